@@ -1,21 +1,48 @@
 # app.py (completo, sin app.run)
-from flask import Flask, render_template, request, jsonify, abort, redirect, url_for, session
+from flask import (Flask, render_template, request, jsonify, abort, redirect, url_for, session,
+                   stream_with_context, g, send_from_directory)
 from werkzeug.utils import secure_filename
 from pathlib import Path
 from datetime import datetime
 import re
+import base64
+import csv
+import io
+import itertools
+import json
+import queue
+import threading
+import time
+import zlib
 
 from db import (
-    init_db, upsert_arrival, list_events, get_arrival, get_conn,
-    create_user, get_user, verify_password
+    init_db, schema_version, SCHEMA_VERSION, upsert_arrival, list_events, changes_since, change_log_bounds, get_arrival, get_conn,
+    create_user, get_counter, release_conn,
+    get_job, list_jobs, on_arrival_write, arrival_cache_get, arrival_cache_put,
+    summary, SUMMARY_PERIODS, SUMMARY_GROUPS, search_items,
+    EXPORT_COLUMNS, iter_export, iter_export_keyed, pool_stats,
+    upsert_arrival_deferred, get_pending_items, get_arrivals, layout_strategy_stats
 )
-from parser_pdf import parse_pdf
+import auth
+import live
+import metrics
+import snapshots
+import storage
+from cache import LRUCache, Entry, make_etag
 
 # ------------- Config -------------
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "cambia-esto-por-uno-muy-seguro"   # cambia por uno largo y aleatorio en prod
-app.config["UPLOAD_FOLDER"] = Path("uploads")
-app.config["UPLOAD_FOLDER"].mkdir(exist_ok=True)
+app.config["UPLOAD_FOLDER"] = storage.STORE_DIR   # PDFs subidos, por contenido (ver storage.py)
+app.config["ARRIVAL_CACHE_SHARED"] = False   # True con varios workers: comparte el JSON vía SQLite
+app.config["SLOW_REQUEST_MS"] = None          # p. ej. 500: loguea requests lentos con desglose por etapa
+app.config["PASSWORD_HASH_METHOD"] = auth.HASH_METHOD   # None = default de werkzeug; cambiarlo re-hashea en el próximo login
+app.config["PASSWORD_HASH_WORKERS"] = auth.HASH_WORKERS
+app.config["UPLOAD_LAZY"] = False             # True: /upload solo lee la fecha; items al abrir el BL
+app.config["READ_ONLY"] = False               # worker solo de lectura (ver create_app)
+
+# detalle de BL ya serializado; se invalida al guardar y se valida con el contador 'arrivals'
+arrival_cache = LRUCache(max_entries=512)
 
 # ------------- Helpers / Auth -------------
 def is_logged() -> bool:
@@ -46,8 +73,82 @@ def role_required(role):
         return deco
     return wrap
 
+def write_required(fn):
+    from functools import wraps
+    @wraps(fn)
+    def deco(*args, **kwargs):
+        if app.config["READ_ONLY"]:
+            abort(503, "Este worker es de solo lectura; la operación debe ir a un worker de escritura.")
+        return fn(*args, **kwargs)
+    return deco
+
 # ------------- App bootstrap -------------
-init_db()
+# Importar este módulo no toca la base ni importa el parser: la preparación la hace
+# create_app (o el primer request, si se sirve `app` directamente).
+app.teardown_appcontext(release_conn)   # devuelve la conexión SQLite del hilo al pool
+on_arrival_write(lambda bl, changes: arrival_cache.invalidate(bl))
+
+_setup_lock = threading.Lock()
+_setup_done = False
+
+def create_app(read_only: bool = False, **config) -> Flask:
+    """Prepara la app para servir. Con gunicorn: `gunicorn 'app:create_app()'`.
+
+    `read_only=True` (p. ej. `'app:create_app(read_only=True)'` en los workers de vendedores)
+    salta la preparación de escritura: no crea ni migra el esquema (exige que la base ya esté
+    en SCHEMA_VERSION), no prepara el almacén de PDFs, no regenera snapshots ni retoma jobs
+    de ingesta, y responde 503 en /upload y PUT /arrival. PyMuPDF se importa recién con el
+    primer PDF a parsear.
+    """
+    global _setup_done
+    with _setup_lock:
+        app.config.update(config)
+        app.config["READ_ONLY"] = read_only
+        try:
+            if read_only:
+                version = schema_version()
+                if version < SCHEMA_VERSION:
+                    raise RuntimeError(f"Esquema en versión {version} (se espera {SCHEMA_VERSION}): "
+                                       "arranca antes un worker de escritura o corre db.init_db()")
+            else:
+                init_db()
+                storage.configure(app.config)
+                snapshots.ensure()
+                import ingest   # retoma jobs que un reinicio dejó a medias (el pool, solo si hay)
+                ingest.start_recovery()
+        finally:
+            release_conn()
+        auth.configure(app.config)
+        _setup_done = True
+    return app
+
+@app.before_request
+def _ensure_setup():
+    if not _setup_done:
+        create_app(read_only=app.config["READ_ONLY"])
+
+@app.before_request
+def _start_timer():
+    g.t0 = time.perf_counter()
+    if app.config["SLOW_REQUEST_MS"]:
+        metrics.start_collect()
+
+@app.after_request
+def _record_timing(resp):
+    t0 = g.pop("t0", None)
+    if t0 is None:
+        return resp
+    elapsed = time.perf_counter() - t0
+    endpoint = request.endpoint or "unknown"
+    metrics.observe("http_request_seconds", elapsed,
+                    endpoint=endpoint, method=request.method, status=resp.status_code)
+    if app.config["SLOW_REQUEST_MS"]:
+        stages = metrics.stage_breakdown(metrics.stop_collect())
+        if elapsed * 1000 >= app.config["SLOW_REQUEST_MS"]:
+            detail = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in sorted(stages.items(), key=lambda kv: -kv[1]))
+            app.logger.warning("request lento %s %s %.1fms [%s]",
+                               request.method, request.path, elapsed * 1000, detail or "sin etapas")
+    return resp
 
 # ------------- Views -------------
 @app.get("/")
@@ -61,12 +162,15 @@ def login():
     if request.method == "POST":
         u = (request.form.get("username") or "").strip()
         p = (request.form.get("password") or "").strip()
-        user = get_user(u)
-        if user and verify_password(user["password_hash"], p):
+        if auth.rate_limited(u, request.remote_addr):
+            return render_template("login.html", error="Demasiados intentos, espera un momento"), 429
+        user = auth.authenticate(u, p)
+        if user:
             session["user"] = u
             session["role"] = user["role"]
             nxt = request.args.get("next") or ("/admin" if user["role"] == "admin" else "/calendario")
             return redirect(nxt)
+        auth.record_failure(u, request.remote_addr)
         return render_template("login.html", error="Usuario o contraseña incorrectos")
     return render_template("login.html")
 
@@ -90,19 +194,182 @@ def calendar_page():
 @app.get("/events")
 @login_required
 def api_events():
-    """Retorna lista de eventos para el calendario: [{id, title, start}]"""
-    events = list_events()
-    return jsonify(events)
+    """Retorna lista de eventos para el calendario: [{id, title, start}]
+
+    Acepta `start`/`end` (YYYY-MM-DD) para limitar al rango visible y responde
+    304 si el `If-None-Match` coincide con el contador de cambios de arrivals.
+    """
+    start = (request.args.get("start") or "").strip() or None
+    end   = (request.args.get("end") or "").strip() or None
+    for d in (start, end):
+        if d and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", d):
+            abort(400, "Formato de fecha inválido (usa YYYY-MM-DD).")
+
+    etag = f"arrivals-{get_counter('arrivals')}-{start or ''}-{end or ''}"
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = jsonify(list_events(start, end))
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+@app.get("/events/stream")
+@login_required
+def api_events_stream():
+    """Server-Sent Events con cada cambio de llegadas: {id, bl, kind, date, old_date}.
+
+    kind: added | moved (cambió la fecha; old_date es la anterior) | updated.
+    Al reconectar el navegador manda Last-Event-ID y se reenvía lo que faltó; si eso ya
+    no está en change_log se emite `reset` y el cliente recarga el mes completo.
+    """
+    q = live.subscribe()
+    last = request.headers.get("Last-Event-ID", type=int)
+    oldest, newest = change_log_bounds()
+    backlog, reset = [], False
+    if last is None:
+        last = newest
+    elif oldest is not None and last + 1 < oldest:
+        reset = True
+    else:
+        # changes_since devuelve de a páginas: seguir hasta alcanzar lo último
+        while page := changes_since(backlog[-1]["id"] if backlog else last):
+            backlog += page
+    release_conn()
+
+    def sse():
+        nonlocal last
+        try:
+            yield "retry: 3000\n\n"
+            if reset:
+                yield "event: reset\ndata: {}\n\n"
+            batch = backlog
+            while True:
+                for ch in batch:
+                    if ch["id"] > last:
+                        last = ch["id"]
+                        yield f"id: {ch['id']}\ndata: {json.dumps(ch, ensure_ascii=False)}\n\n"
+                try:
+                    batch = q.get(timeout=live.HEARTBEAT_S)
+                except queue.Empty:
+                    batch = []
+                    yield ": ping\n\n"
+                    continue
+                if isinstance(batch, live.Overflow):
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+        finally:
+            live.unsubscribe(q)
+
+    resp = app.response_class(sse(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"   # nginx: no acumular el stream
+    return resp
+
+@app.get("/snapshots/<name>")
+@login_required
+def api_snapshot(name: str):
+    """JSON por mes del calendario (ver snapshots.py); no toca SQLite.
+
+    index.json se revalida en cada carga; los meses llevan el hash en el nombre y se
+    cachean por un año.
+    """
+    resp = send_from_directory(snapshots.SNAPSHOT_DIR.resolve(), name)
+    if name == snapshots.INDEX:
+        resp.headers["Cache-Control"] = "private, no-cache"
+    else:
+        resp.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return resp
+
+@app.get("/summary")
+@login_required
+def api_summary():
+    """Totales de metros/rollos/llegadas por período.
+
+    Parámetros: start, end (YYYY-MM-DD), granularity=day|week|month,
+    group_by=port,prefix (opcional, separados por coma).
+    """
+    start = (request.args.get("start") or "").strip() or None
+    end   = (request.args.get("end") or "").strip() or None
+    for d in (start, end):
+        if d and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", d):
+            abort(400, "Formato de fecha inválido (usa YYYY-MM-DD).")
+    granularity = request.args.get("granularity", "day")
+    if granularity not in SUMMARY_PERIODS:
+        abort(400, "granularity debe ser day, week o month")
+    group_by = [g.strip() for g in (request.args.get("group_by") or "").split(",") if g.strip()]
+    if any(g not in SUMMARY_GROUPS for g in group_by):
+        abort(400, "group_by admite: port, prefix")
+
+    etag = f"summary-{get_counter('arrivals')}-{request.query_string.decode()}"
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = jsonify(summary(start, end, granularity, group_by))
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+@app.get("/search")
+@login_required
+def api_search():
+    """Busca items por código (prefijo: 'TX.860') o descripción ('lino victoria').
+
+    Parámetros: q, page (desde 1), per_page (máx. 100). Sin ningún término de al menos
+    SEARCH_MIN_PREFIX caracteres no hay resultados (un prefijo de una letra lo abarca todo).
+    """
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        abort(400, "Falta el parámetro q")
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 20, type=int), 1), 100)
+    total, results = search_items(q, page=page, per_page=per_page)
+    return jsonify({"q": q, "page": page, "per_page": per_page, "total": total, "results": results})
 
 
 @app.get("/arrival/<bl>")
 @login_required
 def api_get_arrival(bl: str):
-    """Retorna detalle de un BL con items (corrige sqlite3.Row -> dict)."""
+    """Retorna detalle de un BL con items (corrige sqlite3.Row -> dict).
+
+    El JSON se guarda serializado en `arrival_cache` con su ETag; responde 304 si
+    el navegador ya tiene esa versión.
+    """
     bl = bl.strip()
     if not bl:
         abort(400, "BL inválido")
 
+    version = get_counter("arrivals")
+    entry = arrival_cache.get(bl, version)
+    if entry is None and app.config["ARRIVAL_CACHE_SHARED"]:
+        shared = arrival_cache_get(bl, version)
+        if shared:
+            entry = Entry(version, *shared)
+            arrival_cache.put(bl, entry)
+    if entry is None:
+        pending = get_pending_items(bl)
+        if pending and not pending["error"] and not app.config["READ_ONLY"]:
+            # primera vista de un BL subido en modo diferido: se extraen los items ahora
+            import ingest
+            ingest.fill_pending(pending)
+            version = get_counter("arrivals")
+            pending = get_pending_items(bl)
+        entry = _build_arrival_entry(bl, version, pending)
+        arrival_cache.put(bl, entry)
+        if app.config["ARRIVAL_CACHE_SHARED"]:
+            arrival_cache_put(bl, version, entry.etag, entry.body)
+
+    if request.if_none_match.contains(entry.etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(entry.body, mimetype="application/json")
+    resp.set_etag(entry.etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+def _build_arrival_entry(bl: str, version: int, pending=None) -> Entry:
     arrival, items = get_arrival(bl)
     if not arrival:
         abort(404, "BL no encontrado")
@@ -118,9 +385,49 @@ def api_get_arrival(bl: str):
         "notes":a.get("notes"),
         "items": its,  # cada item: {code, description, meters, rolls}
     }
-    return jsonify(payload)
+    if pending:
+        payload["items_pending"] = True
+        payload["items_error"] = pending["error"]
+    body = (app.json.dumps(payload) + "\n").encode()
+    return Entry(version, make_etag(body), body)
+
+ARRIVALS_BATCH_MAX = 500
+
+@app.get("/arrivals")
+@app.post("/arrivals/batch")
+@login_required
+def api_get_arrivals():
+    """Detalle de varios BL en una petición, por BL: {"arrivals": {bl: {...}}, "missing": [...]}.
+
+    GET /arrivals?bl=A&bl=B  o  POST /arrivals/batch con {"bls": ["A", "B"]}.
+    Los BL de carga diferida vienen con items_pending (sus items salen de /arrival/<bl>).
+    """
+    if request.method == "POST":
+        data = request.get_json(force=True, silent=True) or {}
+        raw = data.get("bls") or []
+        if not isinstance(raw, list):
+            abort(400, "bls debe ser una lista")
+    else:
+        raw = request.args.getlist("bl")
+    bls = list(dict.fromkeys(str(b).strip() for b in raw if str(b).strip()))
+    if not bls:
+        abort(400, "Indica al menos un BL")
+    if len(bls) > ARRIVALS_BATCH_MAX:
+        abort(400, f"Máximo {ARRIVALS_BATCH_MAX} BL por petición")
+
+    key = make_etag("\n".join(bls).encode())
+    etag = f"arrivals-{get_counter('arrivals')}-{key}"
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        found = get_arrivals(bls)
+        resp = jsonify({"arrivals": found, "missing": [b for b in bls if b not in found]})
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
 @app.put("/arrival/<bl>")
+@write_required
 def api_update_arrival(bl: str):
     if not bl.strip():
         abort(400, "BL inválido")
@@ -145,8 +452,118 @@ def api_update_arrival(bl: str):
     if date and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", date):
         abort(400, "Formato de fecha inválido (usa YYYY-MM-DD).")
 
-    upsert_arrival(bl=bl, date=date, port=port, notes=notes, items=norm_items)
-    return jsonify({"ok": True, "bl": bl, "items": len(norm_items)})
+    changes = upsert_arrival(bl=bl, date=date, port=port, notes=notes, items=norm_items)
+    return jsonify({"ok": True, "bl": bl, "items": len(norm_items), "changes": changes})
+
+# -------- Métricas --------
+@app.get("/metrics")
+@role_required("admin")
+def api_metrics():
+    """Métricas de este proceso en formato de texto de Prometheus."""
+    gauges = []
+    for k, v in pool_stats().items():
+        gauges.append((f"db_pool_{k}", v, {}))
+    for k, v in arrival_cache.stats().items():
+        gauges.append((f"arrival_cache_{k}", v, {}))
+    layouts = layout_strategy_stats()
+    for k in ("layouts", "docs", "hits", "misses"):
+        gauges.append((f"parse_layout_memory_{k}", layouts[k], {}))
+    for strategy, n in layouts["by_strategy"].items():
+        gauges.append(("parse_layout_memory_by_strategy", n, {"strategy": strategy}))
+    body = metrics.render(gauges)
+    return app.response_class(body, mimetype="text/plain; version=0.0.4")
+
+# -------- Exportación (ERP) --------
+def _encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+def _decode_cursor(token: str):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        abort(400, "cursor inválido")
+    if not isinstance(key, list) or len(key) != 4:
+        abort(400, "cursor inválido")
+    return key
+
+def _csv_chunks(rows, batch=500):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(EXPORT_COLUMNS)
+    for n, r in enumerate(rows, 1):
+        w.writerow(r)
+        if n % batch == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def _ndjson_chunks(rows, batch=500):
+    lines = []
+    for r in rows:
+        lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, r)), ensure_ascii=False))
+        if len(lines) >= batch:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+def _gzip_chunks(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits=31 -> formato gzip
+    for c in chunks:
+        out = z.compress(c.encode("utf-8"))
+        if out:
+            yield out
+    yield z.flush()
+
+EXPORT_LIMIT_MAX = 50_000
+
+@app.get("/export")
+@role_required("admin")
+def api_export():
+    """Exporta llegadas + items en streaming (memoria constante).
+
+    Parámetros: format=csv|ndjson, start, end (YYYY-MM-DD), port,
+    limit + cursor para paginar por keyset (el siguiente cursor va en X-Next-Cursor).
+    Se comprime con gzip si el cliente lo acepta.
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        abort(400, "format debe ser csv o ndjson")
+    start = (request.args.get("start") or "").strip() or None
+    end   = (request.args.get("end") or "").strip() or None
+    for d in (start, end):
+        if d and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", d):
+            abort(400, "Formato de fecha inválido (usa YYYY-MM-DD).")
+    port  = (request.args.get("port") or "").strip() or None
+    limit = request.args.get("limit", type=int)
+    if limit is not None and not 1 <= limit <= EXPORT_LIMIT_MAX:
+        abort(400, f"limit debe estar entre 1 y {EXPORT_LIMIT_MAX}")
+    cursor = request.args.get("cursor")
+    after = _decode_cursor(cursor) if cursor else None
+
+    headers = {}
+    if limit:
+        # la página (acotada por limit) se lee antes de responder: el cursor siguiente es la
+        # clave de su última fila y tiene que ir en los headers
+        keyed = iter_export_keyed(start, end, port, after)
+        try:
+            page = list(itertools.islice(keyed, limit + 1))
+        finally:
+            keyed.close()
+        if len(page) > limit:
+            headers["X-Next-Cursor"] = _encode_cursor(page[limit - 1][0])
+        rows = (row for _, row in page[:limit])
+    else:
+        rows = iter_export(start, end, port, after)
+    chunks = _csv_chunks(rows) if fmt == "csv" else _ndjson_chunks(rows)
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    headers["Vary"] = "Accept-Encoding"
+    if "gzip" in request.accept_encodings:
+        chunks = _gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    headers["Content-Disposition"] = f"attachment; filename=llegadas.{fmt}"
+    return app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
 
 # -------- Upload PDF --------
 ALLOWED_EXTENSIONS = {"pdf"}
@@ -155,7 +572,10 @@ def allowed_file(name: str) -> bool:
 
 @app.post("/upload")
 @role_required("admin")
+@write_required
 def upload_pdf():
+    import ingest   # y con él el pool de procesos: solo en los workers que reciben PDFs
+
     if "pdf" not in request.files:
         return abort(400, "Falta archivo PDF (campo 'pdf').")
     f = request.files["pdf"]
@@ -170,26 +590,45 @@ def upload_pdf():
     date  = (request.form.get("date") or "").strip() or None
 
     pdf_name = secure_filename(f.filename)
-    pdf_path = app.config["UPLOAD_FOLDER"] / pdf_name
-    f.save(pdf_path)
-
     if not bl:
-        bl = pdf_path.stem
-
-    date_iso, items = parse_pdf(str(pdf_path))
-    if not date_iso:
-        return abort(400, "No se detectó 'Fecha de llegada a bodega' en el PDF")
-    if not items:
-        return abort(400, "No se detectaron filas en el PDF")
-
-    if date:
-        m1 = re.fullmatch(r"(\d{2})-(\d{2})-(\d{4})", date)
-        if m1:
-            date_iso = f"{m1.group(3)}-{m1.group(2)}-{m1.group(1)}"
-        elif re.fullmatch(r"\d{4}-\d{2}-\d{2}", date):
-            date_iso = date
-
-    upsert_arrival(bl=bl, date=date_iso, port=port, notes=notes, items=items)
-    return jsonify({"ok": True, "bl": bl, "date": date_iso, "port": port, "notes": notes, "items": len(items)})
+        bl = Path(pdf_name).stem
+    # se hashea mientras se copia; si el contenido ya estaba no se escribe de nuevo
+    with metrics.span("upload.save"):
+        stored = storage.save_stream(f.stream, pdf_name, bl)
+    pdf_path = stored.path
+
+    lazy = request.form.get("lazy")
+    lazy = app.config["UPLOAD_LAZY"] if lazy is None else lazy in ("1", "on", "true")
+    if lazy:
+        # solo la fecha ahora; los items se extraen al abrir el BL o con sweep_pending.py
+        from parser_pdf import parse_pdf_date
+        with metrics.span("upload.date"):
+            date_iso = ingest.normalize_date(date) or parse_pdf_date(str(pdf_path))
+        if not date_iso:
+            abort(400, "No se detectó 'Fecha de llegada a bodega' en el PDF")
+        upsert_arrival_deferred(bl, date_iso, pdf_path, port=port, notes=notes)
+        return jsonify({"ok": True, "bl": bl, "date": date_iso, "port": port, "notes": notes,
+                        "items_pending": True, "sha256": stored.sha256, "dedup": stored.dedup}), 201
+
+    # el parseo y el guardado corren en el pool de ingest; el cliente consulta /jobs/<id>
+    job_id = ingest.enqueue(pdf_path, bl, port=port, notes=notes, date=date)
+    return jsonify({"ok": True, "job": job_id, "bl": bl, "sha256": stored.sha256, "dedup": stored.dedup,
+                    "status_url": url_for("api_get_job", job_id=job_id)}), 202
+
+@app.get("/jobs/<int:job_id>")
+@role_required("admin")
+def api_get_job(job_id: int):
+    """Estado de un job de ingesta: queued | running | done | error (+ tiempos y error)."""
+    job = get_job(job_id)
+    if not job:
+        abort(404, "Job no encontrado")
+    return jsonify(job)
+
+@app.get("/jobs")
+@role_required("admin")
+def api_list_jobs():
+    state = (request.args.get("state") or "").strip() or None
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    return jsonify(list_jobs(state=state, limit=limit))
 
 # --------- End of file (sin app.run) ---------
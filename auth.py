@@ -0,0 +1,134 @@
+# auth.py
+# Login con costo acotado: a lo sumo HASH_WORKERS verificaciones de hash a la vez, costo de
+# hash configurable (con rehash transparente al entrar) y límite de intentos por usuario/IP.
+#
+# El pool no libera al hilo del request: este espera el resultado igual que si hasheara él
+# mismo. Lo que cambia es que, con 40 logins juntos, solo HASH_WORKERS compiten por CPU y el
+# resto espera en cola, en vez de repartirse la CPU y terminar todos tarde.
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from db import get_user, update_password_hash
+
+# Método de werkzeug para hashes nuevos; None = el default de werkzeug (scrypt). Al cambiarlo,
+# cada usuario se re-hashea en su próximo login correcto. Uno más barato solo como override
+# explícito (PASSWORD_HASH_METHOD) y después de medir: python loadtest_login.py --bench-hash
+HASH_METHOD = None
+
+# Verificaciones simultáneas como máximo: el resto espera en cola en vez de competir por CPU.
+HASH_WORKERS = 4
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+_prefixes = {}
+
+
+def _method_prefix(method) -> str:
+    """Prefijo que werkzeug escribe para `method`, con los parámetros ya expandidos
+    ('scrypt' -> 'scrypt:32768:8:1', 'pbkdf2:sha256' -> 'pbkdf2:sha256:1000000').
+
+    Se calcula hasheando un valor de prueba una vez por método (en el primer login, no al
+    importar: un hash scrypt cuesta lo mismo que un login).
+    """
+    if method not in _prefixes:
+        h = generate_password_hash("x", method=method) if method else generate_password_hash("x")
+        _prefixes[method] = h.split("$", 1)[0]
+    return _prefixes[method]
+
+
+def configure(config):
+    """Toma PASSWORD_HASH_METHOD / PASSWORD_HASH_WORKERS de app.config si están definidos."""
+    global HASH_METHOD, HASH_WORKERS
+    HASH_METHOD = config.get("PASSWORD_HASH_METHOD", HASH_METHOD)
+    HASH_WORKERS = config.get("PASSWORD_HASH_WORKERS", HASH_WORKERS)
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwhash")
+        return _pool
+
+
+def hash_password(password: str) -> str:
+    if HASH_METHOD:
+        return generate_password_hash(password, method=HASH_METHOD)
+    return generate_password_hash(password)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return password_hash.split("$", 1)[0] != _method_prefix(HASH_METHOD)
+
+
+# ---------------- Límite de intentos ----------------
+class TokenBucket:
+    """Cubeta por clave: `capacity` intentos seguidos, recarga `rate` por segundo."""
+
+    def __init__(self, capacity: float, rate: float, max_keys: int = 10000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, now):
+        tokens, last = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - last) * self.rate)
+
+    def available(self, key: str) -> bool:
+        with self._lock:
+            return self._tokens(key, time.monotonic()) >= 1
+
+    def consume(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            self._buckets[key] = (max(0.0, self._tokens(key, now) - 1), now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+
+    def _prune(self, now):
+        # descarta las cubetas que ya están llenas (equivalen a no tener entrada)
+        full = [k for k, (t, last) in self._buckets.items()
+                if t + (now - last) * self.rate >= self.capacity]
+        for k in full:
+            del self._buckets[k]
+
+
+# Sólo los intentos fallidos gastan fichas: un login correcto no cuenta, así 40 vendedores
+# detrás de la misma IP de bodega pueden entrar a la vez al inicio del turno.
+per_user = TokenBucket(capacity=5, rate=1 / 30)    # 5 fallos, luego 1 cada 30 s
+per_ip = TokenBucket(capacity=20, rate=1 / 3)      # 20 fallos, luego 1 cada 3 s
+
+
+def rate_limited(username: str, ip: str) -> bool:
+    return not (per_ip.available(ip or "?") and per_user.available(username.lower()))
+
+
+def record_failure(username: str, ip: str):
+    per_ip.consume(ip or "?")
+    per_user.consume(username.lower())
+
+
+# ---------------- Login ----------------
+def authenticate(username: str, password: str):
+    """Fila del usuario si la clave es correcta; si no, None. Re-hashea si cambió HASH_METHOD.
+
+    La fila se lee en cada login (una búsqueda por clave primaria en una conexión del pool de
+    db): así un cambio de clave o de usuario hecho desde otro proceso rige de inmediato. El
+    hash se verifica en el pool acotado y este hilo espera el resultado.
+    """
+    user = get_user(username)
+    if not user:
+        return None
+    ok = _get_pool().submit(check_password_hash, user["password_hash"], password).result()
+    if not ok:
+        return None
+    if needs_rehash(user["password_hash"]):
+        update_password_hash(username, _get_pool().submit(hash_password, password).result())
+    return user
@@ -0,0 +1,176 @@
+# bench_parser.py
+# Benchmark + regresión del parser sobre un corpus de packing lists.
+#
+#   python bench_parser.py                       # uploads/, compara con la corrida anterior
+#   python bench_parser.py uploads otros/ --rounds 10
+#   python bench_parser.py --baseline corpus/bench/abc1234.json --max-slowdown 0.2
+#
+# Mide parse_pdf completo y cada estrategia por separado (layout / tablas / líneas):
+# tiempo, páginas/s y filas extraídas; además el pico de RSS de cada una, recorriendo el
+# corpus en un proceso propio (ru_maxrss solo crece: en un mismo proceso cada estrategia
+# heredaría el pico de la anterior). "base" es el proceso solo con los imports.
+# Los items de parse_pdf se comparan con corpus/golden/ (ver check_parser.py).
+# Cada corrida se guarda en corpus/bench/<commit>.json para compararla después.
+# Sale con código 1 si cambian los items o si el throughput cae más del umbral.
+import argparse
+import json
+import multiprocessing
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+import parser_pdf
+from check_parser import golden_path, parse_to_golden
+
+RESULTS_DIR = Path("corpus/bench")
+
+STRATEGIES = {
+    "layout": parser_pdf._parse_rows_layout,
+    "tables": parser_pdf._parse_with_tables,
+    "lines":  parser_pdf._parse_by_lines,
+}
+
+
+def _best_of(fn, rounds):
+    best, result = float("inf"), None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _run_strategy(pdf: Path, fn):
+    items = []
+    with fitz.open(pdf) as doc:
+        for page in doc:
+            items.extend(fn(page))
+    return items
+
+
+def bench_file(pdf: Path, rounds: int) -> dict:
+    with fitz.open(pdf) as doc:
+        pages = doc.page_count
+    t, got = _best_of(lambda: parse_to_golden(pdf), rounds)
+    res = {"pages": pages, "parse_pdf": {"seconds": t, "pages_per_s": pages / t, "items": len(got["items"])}}
+    for name, fn in STRATEGIES.items():
+        t, items = _best_of(lambda: _run_strategy(pdf, fn), rounds)
+        res[name] = {"seconds": t, "pages_per_s": pages / t, "items": len(items)}
+
+    gp = golden_path(pdf)
+    if gp.exists():
+        res["golden"] = "ok" if json.loads(gp.read_text(encoding="utf-8")) == got else "changed"
+    else:
+        res["golden"] = "missing"
+    return res
+
+
+def _peak_rss_child(name, pdfs) -> int:
+    """En un proceso nuevo: recorre el corpus con una estrategia y retorna su ru_maxrss (KB)."""
+    for pdf in map(Path, pdfs):
+        if name == "parse_pdf":
+            parse_to_golden(pdf)
+        elif name != "base":
+            _run_strategy(pdf, STRATEGIES[name])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss_by_strategy(pdfs) -> dict:
+    """{estrategia: pico de RSS en KB}, cada una en su propio proceso (spawn)."""
+    ctx = multiprocessing.get_context("spawn")
+    out = {}
+    for name in ("base", "parse_pdf", *STRATEGIES):
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+            out[name] = ex.submit(_peak_rss_child, name, [str(p) for p in pdfs]).result()
+    return out
+
+
+def git_rev() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "local"
+
+
+def previous_run():
+    runs = sorted(RESULTS_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    return runs[-1] if runs else None
+
+
+def compare(current: dict, baseline: dict, max_slowdown: float) -> list[str]:
+    """Archivos cuyo throughput de parse_pdf cayó más de `max_slowdown` (fracción)."""
+    problems = []
+    for name, cur in current["files"].items():
+        base = baseline.get("files", {}).get(name)
+        if not base:
+            continue
+        b, c = base["parse_pdf"]["pages_per_s"], cur["parse_pdf"]["pages_per_s"]
+        if c < b * (1 - max_slowdown):
+            problems.append(f"{name}: {b:.1f} -> {c:.1f} páginas/s ({(1 - c / b) * 100:.0f}% más lento)")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("corpus", nargs="*", default=["uploads"])
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--baseline", type=Path, help="corrida a comparar (por defecto la anterior)")
+    ap.add_argument("--max-slowdown", type=float, default=0.3, help="caída tolerada de páginas/s (0.3 = 30%%)")
+    args = ap.parse_args()
+
+    pdfs = sorted(p for d in args.corpus for p in Path(d).glob("*.pdf"))
+    if not pdfs:
+        sys.exit(f"Sin PDF en {', '.join(args.corpus)}")
+
+    files = {}
+    for pdf in pdfs:
+        files[pdf.name] = r = bench_file(pdf, args.rounds)
+        per = "  ".join(f"{k} {r[k]['items']:>3} filas {r[k]['pages_per_s']:7.1f} p/s"
+                        for k in ("parse_pdf", *STRATEGIES))
+        print(f"{pdf.name[:40]:<40} [{r['golden']}]  {per}")
+
+    total_pages = sum(r["pages"] for r in files.values())
+    total_s = sum(r["parse_pdf"]["seconds"] for r in files.values())
+    run = {
+        "rev": git_rev(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parser_version": parser_pdf.PARSER_VERSION,
+        "rounds": args.rounds,
+        "peak_rss_kb": peak_rss_by_strategy(pdfs),
+        "pages_per_s": total_pages / total_s,
+        "files": files,
+    }
+    rss = run["peak_rss_kb"]
+    print(f"\nTotal: {len(files)} PDF, {total_pages} páginas, {run['pages_per_s']:.1f} páginas/s")
+    print(f"Pico RSS: base {rss['base'] / 1024:.0f} MB  " + "  ".join(
+        f"{k} +{(v - rss['base']) / 1024:.1f} MB" for k, v in rss.items() if k != "base"))
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    baseline_path = args.baseline or previous_run()
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path and baseline_path.exists() else None
+    out = RESULTS_DIR / f"{run['rev']}.json"
+    out.write_text(json.dumps(run, indent=1) + "\n", encoding="utf-8")
+    print(f"Resultados en {out}")
+
+    failed = False
+    changed = [n for n, r in files.items() if r["golden"] != "ok"]
+    if changed:
+        failed = True
+        print("\n✗ Items distintos de corpus/golden/ (o sin golden): " + ", ".join(changed))
+    if baseline:
+        problems = compare(run, baseline, args.max_slowdown)
+        print(f"Comparado con {baseline_path} ({baseline['rev']})")
+        if problems:
+            failed = True
+            print("✗ Throughput bajo el umbral:\n  " + "\n  ".join(problems))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
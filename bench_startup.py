@@ -0,0 +1,119 @@
+# bench_startup.py
+# Arranque en frío de la app (lo que paga cada worker de gunicorn al levantar), medido con
+# `python -X importtime` en procesos nuevos.
+#
+#   python bench_startup.py                   # import / worker de lectura / de escritura
+#   python bench_startup.py --rounds 15
+#   python bench_startup.py --against HEAD~1  # compara con el arranque de otra revisión
+#
+# Cada modo corre en un directorio temporal con una copia de data.db (una vuelta de
+# calentamiento genera snapshots y la caché de bytecode; no cuenta). Se reporta la mediana del tiempo de
+# pared del snippet, el total de imports según -X importtime y si se cargó PyMuPDF.
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+MODES = {
+    "import app":          "import app",
+    "worker de lectura":   "import app; app.create_app(read_only=True)",
+    "worker de escritura": "import app; app.create_app()",
+    "escritura + parser":  "import app, parser_pdf; app.create_app()",   # lo que evita la carga diferida
+}
+HEAVY = ("fitz", "pymupdf")
+
+
+def _parse_importtime(stderr: str):
+    """(µs totales de imports de primer nivel, nombres importados)."""
+    total, names = 0, set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        names.add(name.strip())
+        if not name.startswith("  "):      # primer nivel: ' nombre'
+            total += int(cumulative)
+    return total, names
+
+
+def measure(src: Path, workdir: Path, snippet: str, rounds: int) -> dict:
+    code = f"import time; t0 = time.perf_counter(); {snippet}; print(time.perf_counter() - t0)"
+    cmd = [sys.executable, "-X", "importtime", "-c", code]
+    env = {**os.environ, "PYTHONPATH": str(src)}
+    walls, imports, names = [], [], set()
+    for i in range(rounds + 1):
+        out = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            raise RuntimeError(f"{snippet!r} falló:\n{out.stderr[-2000:]}")
+        if i == 0:
+            continue    # calentamiento: snapshots, caché de bytecode
+        walls.append(float(out.stdout.strip().splitlines()[-1]))
+        total, names = _parse_importtime(out.stderr)
+        imports.append(total)
+    return {
+        "wall_ms": statistics.median(walls) * 1000,
+        "imports_ms": statistics.median(imports) / 1000,
+        "modules": len(names),
+        "pymupdf": any(n in names for n in HEAVY),
+    }
+
+
+def _extract(rev: str, dest: Path):
+    """Copia de la revisión `rev` (solo lo necesario para importar la app) en `dest`."""
+    data = subprocess.run(["git", "archive", rev], capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=BytesIO(data)) as tar:
+        tar.extractall(dest, members=[m for m in tar.getmembers()
+                                      if m.name.endswith(".py") and "/" not in m.name
+                                      or m.name.startswith(("templates/", "static/"))])
+
+
+def _workdir(tmp: Path, name: str, src: Path) -> Path:
+    """Directorio con una copia de data.db ya migrada (el worker de lectura no migra)."""
+    d = tmp / name
+    d.mkdir()
+    if Path("data.db").exists():
+        shutil.copy("data.db", d / "data.db")
+    subprocess.run([sys.executable, "-c", "import db; db.init_db()"], cwd=d, check=True,
+                   env={**os.environ, "PYTHONPATH": str(src)}, capture_output=True)
+    return d
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tiempo de arranque de la app por tipo de worker.")
+    ap.add_argument("--rounds", type=int, default=7)
+    ap.add_argument("--against", metavar="REV", help="revisión de git con la que comparar")
+    args = ap.parse_args()
+
+    here = Path(__file__).resolve().parent
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        rows = []
+        if args.against:
+            old = tmp / "src-old"
+            old.mkdir()
+            _extract(args.against, old)
+            # antes de create_app, importar app ya hacía toda la preparación
+            snippet = "import app" + ("; app.create_app()" if "def create_app" in (old / "app.py").read_text() else "")
+            rows.append((f"{args.against}: arranque", measure(old, _workdir(tmp, "old", old), snippet, args.rounds)))
+        for i, (label, snippet) in enumerate(MODES.items()):
+            rows.append((label, measure(here, _workdir(tmp, f"w{i}", here), snippet, args.rounds)))
+
+    print(f"{'modo':<24} {'pared':>9} {'imports':>9} {'módulos':>8}  PyMuPDF")
+    for label, r in rows:
+        print(f"{label:<24} {r['wall_ms']:7.1f}ms {r['imports_ms']:7.1f}ms {r['modules']:>8}  "
+              f"{'sí' if r['pymupdf'] else 'no'}")
+    if args.against:
+        res = dict(rows)
+        base = rows[0][1]["wall_ms"]
+        print(f"\nContra {args.against}: escritura {base:.1f} -> {res['worker de escritura']['wall_ms']:.1f} ms, "
+              f"lectura {base:.1f} -> {res['worker de lectura']['wall_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
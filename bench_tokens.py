@@ -0,0 +1,73 @@
+# bench_tokens.py
+# Micro-benchmark del clasificador de tokens sobre los PDF de muestra.
+#
+#   python bench_tokens.py [directorio_o_glob] [--rounds N]
+#
+# "antes": las funciones originales con re.fullmatch sobre patrones en texto
+# (una búsqueda en la caché de `re` por llamada, tres llamadas por token).
+# "después": pdf_tokens.TokenPatterns.tokenize (un fullmatch compilado por token).
+import argparse
+import glob
+import re
+import time
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from parser_pdf import PREFIXES, PREFIX_RE_STR
+from pdf_tokens import patterns_for
+
+
+def _legacy_classify(tok):
+    # réplica de _looks_number / _is_int_token / _is_code_token previos
+    number = bool(re.fullmatch(r"[\d.,]+", tok or ""))
+    integer = bool(re.fullmatch(r"\d{1,6}", tok or ""))
+    t = (tok or "").strip()
+    code = bool(t) and bool(
+        re.fullmatch(PREFIX_RE_STR, t.upper())
+        or t in {".", "-", "·"}
+        or re.fullmatch(r"\d+\.?", t)
+        or re.fullmatch(PREFIX_RE_STR + r"\.?", t.upper())
+    )
+    alpha = bool(re.fullmatch(r"[A-Za-z]{2,6}", tok or ""))
+    return number, integer, code, alpha
+
+
+def load_words(target):
+    p = Path(target)
+    files = sorted(p.glob("*.pdf")) if p.is_dir() else sorted(Path(f) for f in glob.glob(target))
+    words = []
+    for f in files:
+        with fitz.open(f) as doc:
+            for page in doc:
+                words.extend(page.get_text("words"))
+    return files, words
+
+
+def bench(fn, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("target", nargs="?", default="uploads")
+    ap.add_argument("--rounds", type=int, default=20)
+    args = ap.parse_args()
+
+    files, words = load_words(args.target)
+    if not words:
+        raise SystemExit(f"Sin palabras en {args.target}")
+    pats = patterns_for(frozenset(PREFIXES))
+
+    before = bench(lambda: [_legacy_classify(w[4]) for w in words], args.rounds)
+    after = bench(lambda: pats.tokenize(words), args.rounds)
+
+    n = len(words)
+    print(f"{len(files)} PDF, {n} tokens, mejor de {args.rounds} rondas")
+    print(f"  antes:   {n / before:12,.0f} tokens/s")
+    print(f"  después: {n / after:12,.0f} tokens/s  (x{before / after:.1f})")
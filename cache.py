@@ -0,0 +1,78 @@
+# cache.py
+# Caché LRU en memoria para respuestas ya serializadas (bytes + ETag).
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+
+class Entry(NamedTuple):
+    version: int      # contador de cambios con que se generó (ver db.get_counter)
+    etag: str
+    body: bytes
+
+
+def make_etag(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()[:20]
+
+
+class LRUCache:
+    """LRU acotado por cantidad de entradas y por bytes de `body`."""
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, version: int) -> Optional[Entry]:
+        """Entrada vigente para `key`, o None si no existe o es de otra versión."""
+        with self._lock:
+            e = self._data.get(key)
+            if e is None or e.version != version:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return e
+
+    def put(self, key: str, entry: Entry):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._data[key] = entry
+            self._bytes += len(entry.body)
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, ev = self._data.popitem(last=False)
+                self._bytes -= len(ev.body)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            overhead = sys.getsizeof(self._data) + sum(
+                sys.getsizeof(k) + sys.getsizeof(e) + sys.getsizeof(e.etag) for k, e in self._data.items()
+            )
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+                "body_bytes": self._bytes,
+                "memory_bytes": self._bytes + overhead,
+            }
@@ -0,0 +1,70 @@
+# check_parser.py
+# Verifica que parse_pdf siga extrayendo exactamente lo mismo sobre el corpus.
+#
+#   python check_parser.py               # compara uploads/*.pdf con corpus/golden/
+#   python check_parser.py otra_carpeta  # otro corpus (mismo directorio de golden)
+#   python check_parser.py --update      # regraba los golden (tras revisar el cambio)
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from parser_pdf import parse_pdf
+
+GOLDEN_DIR = Path("corpus/golden")
+
+
+def golden_path(pdf: Path) -> Path:
+    return GOLDEN_DIR / f"{pdf.stem}.json"
+
+
+def parse_to_golden(pdf: Path) -> dict:
+    date_iso, items = parse_pdf(str(pdf))
+    return {"date": date_iso, "items": items}
+
+
+def diff_items(expected: list, got: list) -> list[str]:
+    out = []
+    for i in range(max(len(expected), len(got))):
+        e = expected[i] if i < len(expected) else None
+        g = got[i] if i < len(got) else None
+        if e != g:
+            out.append(f"    fila {i}: esperado {e} / obtenido {g}")
+    return out
+
+
+def check(pdfs: list[Path], update: bool = False) -> int:
+    failures = 0
+    for pdf in pdfs:
+        got = parse_to_golden(pdf)
+        gp = golden_path(pdf)
+        if update:
+            gp.parent.mkdir(parents=True, exist_ok=True)
+            gp.write_text(json.dumps(got, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+            print(f"✓ {pdf.name}: {len(got['items'])} filas guardadas")
+            continue
+        if not gp.exists():
+            print(f"? {pdf.name}: sin golden (usa --update)")
+            failures += 1
+            continue
+        expected = json.loads(gp.read_text(encoding="utf-8"))
+        if expected == got:
+            print(f"✓ {pdf.name}: {len(got['items'])} filas")
+            continue
+        failures += 1
+        print(f"✗ {pdf.name}")
+        if expected["date"] != got["date"]:
+            print(f"    fecha: esperado {expected['date']} / obtenido {got['date']}")
+        print("\n".join(diff_items(expected["items"], got["items"])))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("corpus", nargs="?", default="uploads")
+    ap.add_argument("--update", action="store_true")
+    args = ap.parse_args()
+    pdfs = sorted(Path(args.corpus).glob("*.pdf"))
+    if not pdfs:
+        sys.exit(f"Sin PDF en {args.corpus}")
+    sys.exit(check(pdfs, update=args.update))
@@ -1,19 +1,134 @@
 # db.py
+import json
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from metrics import timed
+
 DB_PATH = Path("data.db")
 
+# ---------------- Pool de conexiones ----------------
+# Cada hilo toma una conexión del pool (la primera vez que la pide) y la conserva
+# hasta que release_conn() la devuelve; en Flask eso lo hace el teardown del request.
+POOL_SIZE = 8
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",       # lectores no se bloquean con el writer (upload)
+    "PRAGMA synchronous = NORMAL",     # seguro en WAL, evita fsync por commit
+    "PRAGMA cache_size = -16000",      # ~16 MB de page cache por conexión
+    "PRAGMA mmap_size = 268435456",    # 256 MB mapeados en memoria
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=POOL_SIZE)
+_pool_pid = os.getpid()
+_local = threading.local()
+_inherited = []   # conexiones heredadas por fork: no se cierran desde el hijo
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+    """Abre una conexión nueva ya configurada (fuera del pool)."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+
+def _reset_pool_after_fork():
+    """Tras un fork (workers de gunicorn) las conexiones del padre no se reutilizan."""
+    global _pool, _pool_pid, _local
+    if _pool_pid != os.getpid():
+        _inherited.append((_pool, _local))
+        _pool = queue.LifoQueue(maxsize=POOL_SIZE)
+        _local = threading.local()
+        _pool_pid = os.getpid()
+
+
+def acquire_conn() -> sqlite3.Connection:
+    _reset_pool_after_fork()
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    try:
+        conn = _pool.get_nowait()
+        hit = True
+    except queue.Empty:
+        conn = get_conn()
+        hit = False
+    with _stats_lock:
+        _stats["hits" if hit else "misses"] += 1
+    _local.conn = conn
+    return conn
+
+
+def release_conn(exc=None):
+    """Devuelve la conexión del hilo al pool (se registra como teardown en Flask)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+@contextmanager
+def connection():
+    """Conexión del hilo actual; hace commit al salir o rollback si hubo error."""
+    conn = acquire_conn()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def pool_stats() -> dict:
+    with _stats_lock:
+        return {**_stats, "idle": _pool.qsize(), "size": POOL_SIZE}
+
+
 def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
+    """Crea/migra el esquema si la base no está en SCHEMA_VERSION (PRAGMA user_version).
 
+    Con la base al día es una sola lectura del PRAGMA: no corre los CREATE en cada arranque.
+    Si arrancan varios procesos a la vez, BEGIN IMMEDIATE deja migrar a uno solo.
+    """
+    conn = acquire_conn()
+    try:
+        if schema_version(conn) >= SCHEMA_VERSION:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.cursor()
+        if schema_version(conn) < SCHEMA_VERSION:   # otro proceso pudo migrar mientras esperábamos
+            _create_schema(cur)
+            _migrate(cur)
+        conn.commit()
+    finally:
+        release_conn()
+
+
+def schema_version(conn=None) -> int:
+    conn = conn or acquire_conn()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _create_schema(cur):
     # --- Llegadas (contenedores) ---
     cur.execute("""
     CREATE TABLE IF NOT EXISTS arrivals(
@@ -34,10 +149,89 @@ def init_db():
         description TEXT,
         meters      REAL,
         rolls       INTEGER,
+        position    INTEGER,      -- orden dentro del BL
         FOREIGN KEY(arrival_bl) REFERENCES arrivals(bl)
     );
     """)
 
+    # --- Índice para consultas por rango de fechas (/events?start=&end=) ---
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_arrivals_date ON arrivals(date)")
+
+    # --- Contadores de cambios (ETag de /events) ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS counters(
+        name  TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    cur.execute("INSERT OR IGNORE INTO counters(name, value) VALUES('arrivals', 0)")
+    for op in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_arrivals_{op.lower()}_counter
+        AFTER {op} ON arrivals
+        BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'arrivals';
+        END;
+        """)
+
+    # --- Caché de parseo de PDFs (sha256 del archivo + versión del parser) ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS parse_cache(
+        sha256     TEXT PRIMARY KEY,
+        stamp      TEXT NOT NULL,   -- versión del parser + PREFIXES
+        date_iso   TEXT,
+        items_json TEXT NOT NULL,
+        strategy   TEXT,
+        size       INTEGER NOT NULL,
+        last_used  REAL NOT NULL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_parse_cache_last_used ON parse_cache(last_used)")
+
+    # --- Cola de ingesta de PDFs (ver ingest.py) ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs(
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        state       TEXT NOT NULL DEFAULT 'queued'
+                    CHECK(state IN ('queued','running','done','error')),
+        pdf_path    TEXT NOT NULL,
+        bl          TEXT NOT NULL,
+        port        TEXT,
+        notes       TEXT,
+        date        TEXT,      -- fecha forzada desde el formulario (opcional)
+        result_json TEXT,
+        error       TEXT,
+        created_at  REAL NOT NULL,
+        started_at  REAL,
+        finished_at REAL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state)")
+
+    # --- Archivos ya ingeridos por carga masiva (ingest_dir.py) ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ingested_files(
+        sha256      TEXT PRIMARY KEY,
+        path        TEXT NOT NULL,
+        bl          TEXT NOT NULL,
+        ingested_at REAL NOT NULL
+    );
+    """)
+
+    # --- Caché compartida de /arrival/<bl> entre workers (JSON ya serializado) ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS arrival_cache(
+        bl      TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,   -- contador 'arrivals' al generarla
+        etag    TEXT NOT NULL,
+        body    BLOB NOT NULL
+    );
+    """)
+
+    _schema_rollup(cur)
+    _schema_items_fts(cur)
+    _schema_v4_tables(cur)
+
     # --- Usuarios (admin/vendor) ---
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users(
@@ -48,77 +242,945 @@ def init_db():
     );
     """)
 
-    conn.commit()
-    conn.close()
+def _schema_rollup(cur):
+    # --- Totales por día / puerto / prefijo (los mantiene upsert_arrival) ---
+    # prefix '*' = todos los prefijos, para contar cada BL una sola vez
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_daily(
+        date     TEXT NOT NULL,
+        port     TEXT NOT NULL DEFAULT '',
+        prefix   TEXT NOT NULL,
+        meters   REAL NOT NULL DEFAULT 0,
+        rolls    INTEGER NOT NULL DEFAULT 0,
+        arrivals INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(date, port, prefix)
+    );
+    """)
+
+def _schema_items_fts(cur):
+    # --- Búsqueda de texto sobre items (FTS5, contenido externo = items) ---
+    # '.' cuenta como parte del token: 'TX.860.01.0004' se indexa entero y se busca por prefijo
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        code, description,
+        content='items', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2 tokenchars '.'"
+    );
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_items_fts_insert AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts(rowid, code, description) VALUES (new.id, new.code, new.description);
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_items_fts_delete AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, code, description) VALUES ('delete', old.id, old.code, old.description);
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_items_fts_update AFTER UPDATE OF code, description ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, code, description) VALUES ('delete', old.id, old.code, old.description);
+        INSERT INTO items_fts(rowid, code, description) VALUES (new.id, new.code, new.description);
+    END;
+    """)
+
+def _schema_v4_tables(cur):
+    # --- Llegadas subidas en modo diferido: items por extraer del PDF (ver ingest.fill_pending) ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS pending_items(
+        bl         TEXT PRIMARY KEY,
+        pdf_path   TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        error      TEXT       -- último error al extraer (no se reintenta al abrir el BL)
+    );
+    """)
+
+    # --- Registro de cambios de llegadas (alimenta /events/stream en todos los workers) ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_log(
+        id       INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts       REAL NOT NULL,
+        bl       TEXT NOT NULL,
+        kind     TEXT NOT NULL CHECK(kind IN ('added','moved','updated')),
+        date     TEXT,
+        old_date TEXT
+    );
+    """)
+
+    # --- Estrategia de parseo que funcionó por formato de documento (ver parser_pdf.PdfStream) ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS layout_strategies(
+        fingerprint TEXT PRIMARY KEY,
+        sample      TEXT,                          -- tamaño | membrete | encabezados
+        strategy    TEXT NOT NULL CHECK(strategy IN ('layout','tables','lines')),
+        params_json TEXT NOT NULL DEFAULT '{}',
+        docs        INTEGER NOT NULL DEFAULT 0,    -- documentos vistos con este formato
+        hits        INTEGER NOT NULL DEFAULT 0,    -- fueron directo a la estrategia correcta
+        misses      INTEGER NOT NULL DEFAULT 0,    -- la recordada no sirvió y se recorrió la cadena
+        updated_at  REAL NOT NULL
+    );
+    """)
+
+    # --- PDFs subidos, por contenido (ver storage.py) ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS uploads(
+        sha256     TEXT PRIMARY KEY,
+        size       INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_seen  REAL NOT NULL      -- última subida de este contenido (cualquier nombre)
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS upload_names(
+        sha256      TEXT NOT NULL,
+        filename    TEXT NOT NULL,
+        bl          TEXT NOT NULL,
+        uploaded_at REAL NOT NULL,
+        PRIMARY KEY(sha256, filename, bl)
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_upload_names_bl ON upload_names(bl, uploaded_at)")
+
+# ---------------- Migraciones ----------------
+# Cada paso lleva la base de la versión i a la i+1 (PRAGMA user_version) y crea por sí mismo
+# (IF NOT EXISTS) lo que usa, sin depender de que _create_schema haya corrido antes: al
+# agregar una tabla o un índice, ponerlo en una función _schema_* que llamen tanto
+# _create_schema como el paso nuevo.
+def _m1_items_position_and_indexes(cur):
+    cols = {r["name"] for r in cur.execute("PRAGMA table_info(items)")}
+    if "position" not in cols:
+        cur.execute("ALTER TABLE items ADD COLUMN position INTEGER")
+        cur.execute("UPDATE items SET position = id")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_bl_code ON items(arrival_bl, code)")
+
+def _m2_rollup_backfill(cur):
+    _schema_rollup(cur)
+    _rebuild_rollup(cur)
+
+def _m3_items_fts_rebuild(cur):
+    _schema_items_fts(cur)
+    cur.execute("INSERT INTO items_fts(items_fts) VALUES('rebuild')")
+
+def _m4_schema_tables(cur):
+    _schema_v4_tables(cur)
+
+def _m5_export_indexes(cur):
+    # /export recorre llegadas por (date, bl) y los items de cada una por (position, id)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_arrivals_date_bl ON arrivals(date, bl)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_bl_position ON items(arrival_bl, position, id)")
+
+MIGRATIONS = [
+    _m1_items_position_and_indexes,
+    _m2_rollup_backfill,
+    _m3_items_fts_rebuild,
+    _m4_schema_tables,
+    _m5_export_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def _migrate(cur):
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    for target, step in enumerate(MIGRATIONS, start=1):
+        if version < target:
+            step(cur)
+            cur.execute(f"PRAGMA user_version = {target}")
 
 # ---------------- Usuarios ----------------
-def create_user(username: str, password: str, role: str = "vendor"):
+@timed("db.create_user")
+def create_user(username: str, password: str, role: str = "vendor", hash_method: str | None = None):
     if role not in ("admin", "vendor"):
         raise ValueError("Rol inválido")
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO users(username, password_hash, role) VALUES(?,?,?)",
-                (username.strip(), generate_password_hash(password.strip()), role))
-    conn.commit()
-    conn.close()
+    pw_hash = (generate_password_hash(password.strip(), method=hash_method) if hash_method
+               else generate_password_hash(password.strip()))
+    with connection() as conn:
+        conn.execute("INSERT INTO users(username, password_hash, role) VALUES(?,?,?)",
+                     (username.strip(), pw_hash, role))
 
+@timed("db.update_password_hash")
+def update_password_hash(username: str, password_hash: str):
+    with connection() as conn:
+        conn.execute("UPDATE users SET password_hash = ? WHERE username = ?", (password_hash, username.strip()))
+
+@timed("db.get_user")
 def get_user(username: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE username = ?", (username.strip(),))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    with connection() as conn:
+        cur = conn.execute("SELECT * FROM users WHERE username = ?", (username.strip(),))
+        return cur.fetchone()
 
 def verify_password(password_hash: str, password_plain: str) -> bool:
     return check_password_hash(password_hash, password_plain)
 
 # ---------------- Llegadas / Calendario ----------------
-def upsert_arrival(bl, date, port=None, notes=None, items=None):
-    conn = get_conn()
-    cur = conn.cursor()
+# Funciones fn(bl, changes) que se llaman tras guardar una llegada que cambió
+# (invalidación de cachés); `changes` es lo que retorna upsert_arrival.
+_arrival_listeners = []
 
-    # inserta o actualiza cabecera
-    cur.execute(
-        "INSERT OR REPLACE INTO arrivals(bl, date, port, notes) VALUES(?, ?, ?, ?)",
-        (bl, date, port, notes)
-    )
+def on_arrival_write(fn):
+    _arrival_listeners.append(fn)
+    return fn
+
+def _notify_arrival_write(changes_list):
+    for changes in changes_list:
+        if not changes["changed"]:
+            continue
+        for fn in _arrival_listeners:
+            fn(changes["bl"], changes)
+
+def _item_row(it):
+    return (it.get("code", ""), it.get("description", ""),
+            float(it.get("meters", 0)), int(it.get("rolls", 0)))
+
+ITEM_CHUNK = 500   # filas por executemany al escribir items que llegan de un generador
+
+def _write_arrival(cur, bl, date, port=None, notes=None, items=None):
+    """Aplica solo las diferencias respecto de lo guardado. Retorna el resumen de cambios.
+
+    `items` puede ser cualquier iterable (p. ej. las páginas de un PdfStream): se escribe por
+    tandas de ITEM_CHUNK sin armar la lista completa. `date` puede ser un callable; se
+    evalúa después de consumir los items (cuando la fecha sale del mismo recorrido).
+    """
+    changes = {"bl": bl, "date": None, "created": False, "header": False, "old_date": None,
+               "items_added": 0, "items_updated": 0, "items_removed": 0, "changed": False}
+
+    old = cur.execute("SELECT date, port, notes FROM arrivals WHERE bl = ?", (bl,)).fetchone()
+    old_contrib = _rollup_contribution(cur, bl) if old is not None else {}
+
+    # ---------- items: diff por (código, n-ésima aparición) ----------
+    existing, occ = {}, {}
+    for r in cur.execute(
+        "SELECT id, code, description, meters, rolls, position FROM items "
+        "WHERE arrival_bl = ? ORDER BY position, id", (bl,)
+    ).fetchall():
+        n = occ.get(r["code"], 0)
+        occ[r["code"]] = n + 1
+        existing[(r["code"], n)] = r
+
+    seen, inserts, updates = {}, [], []
+
+    def flush():
+        if updates:
+            cur.executemany(
+                "UPDATE items SET description = ?, meters = ?, rolls = ?, position = ? WHERE id = ?", updates
+            )
+        if inserts:
+            cur.executemany(
+                """INSERT INTO items(arrival_bl, code, description, meters, rolls, position)
+                   VALUES(?,?,?,?,?,?)""",
+                inserts
+            )
+        changes["items_added"] += len(inserts)
+        changes["items_updated"] += len(updates)
+        inserts.clear()
+        updates.clear()
+
+    for pos, it in enumerate(items or []):
+        code, desc, meters, rolls = _item_row(it)
+        n = seen.get(code, 0)
+        seen[code] = n + 1
+        r = existing.pop((code, n), None)
+        if r is None:
+            inserts.append((bl, code, desc, meters, rolls, pos))
+        elif (r["description"], r["meters"], r["rolls"], r["position"]) != (desc, meters, rolls, pos):
+            updates.append((desc, meters, rolls, pos, r["id"]))
+        if len(inserts) + len(updates) >= ITEM_CHUNK:
+            flush()
+    flush()
+    deletes = [(r["id"],) for r in existing.values()]
+    if deletes:
+        cur.executemany("DELETE FROM items WHERE id = ?", deletes)
+    changes["items_removed"] = len(deletes)
 
-    # borra items del BL y re-inserta
-    cur.execute("DELETE FROM items WHERE arrival_bl = ?", (bl,))
-    if items:
+    # ---------- cabecera ----------
+    if callable(date):
+        date = date()
+    changes["date"] = date
+    if old is None:
+        changes["created"] = changes["header"] = True
+    elif (old["date"], old["port"], old["notes"]) != (date, port, notes):
+        changes["header"] = True
+        if old["date"] != date:
+            changes["old_date"] = old["date"]
+    if changes["header"]:
+        cur.execute(
+            """INSERT INTO arrivals(bl, date, port, notes) VALUES(?, ?, ?, ?)
+               ON CONFLICT(bl) DO UPDATE SET
+                   date = excluded.date, port = excluded.port, notes = excluded.notes""",
+            (bl, date, port, notes)
+        )
+
+    changes["changed"] = bool(changes["header"] or changes["items_added"]
+                              or changes["items_updated"] or changes["items_removed"])
+    # items escritos explícitamente: lo que quedara pendiente de una carga diferida ya no aplica
+    cur.execute("DELETE FROM pending_items WHERE bl = ?", (bl,))
+
+    if changes["changed"]:
+        if not changes["header"]:
+            # solo cambiaron items: igual hay que invalidar ETags/cachés basados en el contador
+            cur.execute("UPDATE counters SET value = value + 1 WHERE name = 'arrivals'")
+        # la copia compartida del detalle queda obsoleta en la misma transacción
+        cur.execute("DELETE FROM arrival_cache WHERE bl = ?", (bl,))
+        _apply_rollup_delta(cur, old_contrib, _rollup_contribution(cur, bl))
+        _log_change(cur, changes)
+    return changes
+
+CHANGE_LOG_KEEP = 5000   # últimos cambios que se conservan para reconexiones de /events/stream
+
+def _log_change(cur, changes):
+    kind = "added" if changes["created"] else "moved" if changes["old_date"] else "updated"
+    cur.execute("INSERT INTO change_log(ts, bl, kind, date, old_date) VALUES(?,?,?,?,?)",
+                (time.time(), changes["bl"], kind, changes["date"], changes["old_date"]))
+    if cur.lastrowid % 100 == 0:
+        cur.execute("DELETE FROM change_log WHERE id <= ?", (cur.lastrowid - CHANGE_LOG_KEEP,))
+
+# ---------------- Rollup por día ----------------
+def _prefix_of(code) -> str:
+    return (code or "").split(".", 1)[0].strip().upper()
+
+def _rollup_contribution(cur, bl) -> dict:
+    """Aporte de un BL al rollup: {(date, port, prefix): [meters, rolls, arrivals]}."""
+    head = cur.execute("SELECT date, port FROM arrivals WHERE bl = ?", (bl,)).fetchone()
+    if head is None or not head["date"]:
+        return {}
+    date, port = head["date"], head["port"] or ""
+    out = {(date, port, "*"): [0.0, 0, 1]}
+    for r in cur.execute(
+        "SELECT code, COALESCE(SUM(meters), 0) AS m, COALESCE(SUM(rolls), 0) AS r "
+        "FROM items WHERE arrival_bl = ? GROUP BY code", (bl,)
+    ).fetchall():
+        key = (date, port, _prefix_of(r["code"]))
+        acc = out.setdefault(key, [0.0, 0, 1])
+        acc[0] += r["m"]
+        acc[1] += r["r"]
+        tot = out[(date, port, "*")]
+        tot[0] += r["m"]
+        tot[1] += r["r"]
+    return out
+
+def _apply_rollup_delta(cur, old: dict, new: dict):
+    rows = []
+    for key in old.keys() | new.keys():
+        o, n = old.get(key, (0.0, 0, 0)), new.get(key, (0.0, 0, 0))
+        delta = (n[0] - o[0], n[1] - o[1], n[2] - o[2])
+        if delta != (0.0, 0, 0):
+            rows.append((*key, *delta))
+    if not rows:
+        return
+    cur.executemany(
+        """INSERT INTO rollup_daily(date, port, prefix, meters, rolls, arrivals) VALUES(?,?,?,?,?,?)
+           ON CONFLICT(date, port, prefix) DO UPDATE SET
+               meters = meters + excluded.meters,
+               rolls = rolls + excluded.rolls,
+               arrivals = arrivals + excluded.arrivals""",
+        rows
+    )
+    # solo pueden quedar en cero las claves a las que se les restaron llegadas
+    gone = [key for *key, _, _, arrivals in rows if arrivals < 0]
+    if gone:
         cur.executemany(
-            """INSERT INTO items(arrival_bl, code, description, meters, rolls)
-               VALUES(?,?,?,?,?)""",
-            [(bl,
-              it.get("code", ""),
-              it.get("description", ""),
-              float(it.get("meters", 0)),
-              int(it.get("rolls", 0)))
-             for it in items]
+            "DELETE FROM rollup_daily WHERE date = ? AND port = ? AND prefix = ? AND arrivals <= 0",
+            gone
         )
 
-    conn.commit()
-    conn.close()
+def _rebuild_rollup(cur):
+    cur.execute("DELETE FROM rollup_daily")
+    for r in cur.execute("SELECT bl FROM arrivals").fetchall():
+        _apply_rollup_delta(cur, {}, _rollup_contribution(cur, r["bl"]))
+
+SUMMARY_PERIODS = {
+    "day":   "date",
+    "week":  "date(date, '-' || ((CAST(strftime('%w', date) AS INTEGER) + 6) % 7) || ' days')",  # lunes
+    "month": "substr(date, 1, 7)",
+}
+SUMMARY_GROUPS = ("port", "prefix")
 
+@timed("db.summary")
+def summary(start=None, end=None, granularity="day", group_by=()):
+    """Totales de metros/rollos/llegadas por período desde rollup_daily.
 
-def list_events():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT bl, date FROM arrivals ORDER BY date")
-    rows = cur.fetchall()
-    conn.close()
+    `group_by` puede incluir 'port' y/o 'prefix'; sin 'prefix' se usan las filas '*'.
+    """
+    period = SUMMARY_PERIODS[granularity]
+    groups = [g for g in SUMMARY_GROUPS if g in group_by]
+    where, args = ["prefix <> '*'" if "prefix" in groups else "prefix = '*'"], []
+    if start:
+        where.append("date >= ?")
+        args.append(start)
+    if end:
+        where.append("date <= ?")
+        args.append(end)
+    cols = ", ".join(["period"] + groups)
+    sql = (f"SELECT {period} AS period{''.join(', ' + g for g in groups)}, "
+           f"SUM(meters) AS meters, SUM(rolls) AS rolls, SUM(arrivals) AS arrivals "
+           f"FROM rollup_daily WHERE {' AND '.join(where)} GROUP BY {cols} ORDER BY {cols}")
+    with connection() as conn:
+        rows = conn.execute(sql, args).fetchall()
+    out = []
+    for r in rows:
+        d = {"period": r["period"]}
+        for g in groups:
+            d[g] = r[g] or None
+        d.update(meters=round(r["meters"], 2), rolls=r["rolls"], arrivals=r["arrivals"])
+        out.append(d)
+    return out
+
+@timed("db.upsert_arrival")
+def upsert_arrival(bl, date, port=None, notes=None, items=None):
+    """Crea o actualiza una llegada tocando solo lo que cambió; retorna el resumen de cambios.
+
+    Acepta un generador de items y una fecha diferida (ver _write_arrival); si el generador
+    lanza una excepción no queda nada escrito.
+    """
+    with connection() as conn:
+        changes = _write_arrival(conn.cursor(), bl, date, port, notes, items)
+    _notify_arrival_write([changes])
+    return changes
+
+@timed("db.upsert_arrival_deferred")
+def upsert_arrival_deferred(bl, date, pdf_path, port=None, notes=None):
+    """Guarda solo la cabecera y deja los items pendientes de extraer desde `pdf_path`."""
+    with connection() as conn:
+        cur = conn.cursor()
+        changes = _write_arrival(cur, bl, date, port, notes, items=[])
+        cur.execute("INSERT OR REPLACE INTO pending_items(bl, pdf_path, created_at) VALUES(?,?,?)",
+                    (bl, str(pdf_path), time.time()))
+        if not changes["changed"]:
+            # mismo encabezado y sin items: igual cambia lo que verá GET /arrival
+            cur.execute("UPDATE counters SET value = value + 1 WHERE name = 'arrivals'")
+            cur.execute("DELETE FROM arrival_cache WHERE bl = ?", (bl,))
+            changes["changed"] = True
+            _log_change(cur, changes)
+    _notify_arrival_write([changes])
+    return changes
+
+@timed("db.get_pending_items")
+def get_pending_items(bl):
+    with connection() as conn:
+        return conn.execute("SELECT * FROM pending_items WHERE bl = ?", (bl,)).fetchone()
+
+@timed("db.list_pending_items")
+def list_pending_items(older_than=None, limit=None, with_errors=False):
+    """BLs con items pendientes, los más antiguos primero."""
+    sql, args = "SELECT * FROM pending_items WHERE 1", []
+    if not with_errors:
+        sql += " AND error IS NULL"
+    if older_than is not None:
+        sql += " AND created_at <= ?"
+        args.append(older_than)
+    sql += " ORDER BY created_at"
+    if limit:
+        sql += " LIMIT ?"
+        args.append(limit)
+    with connection() as conn:
+        return conn.execute(sql, args).fetchall()
+
+@timed("db.complete_pending_items")
+def complete_pending_items(bl, pdf_path, items):
+    """Guarda los items extraídos conservando la cabecera actual (pudo editarse mientras tanto).
+
+    Retorna los cambios, o None si el pendiente ya no existe o es de otro PDF
+    (otro proceso lo completó, o el BL se volvió a subir/editar).
+    """
+    with connection() as conn:
+        cur = conn.cursor()
+        row = cur.execute("SELECT pdf_path FROM pending_items WHERE bl = ?", (bl,)).fetchone()
+        head = cur.execute("SELECT date, port, notes FROM arrivals WHERE bl = ?", (bl,)).fetchone()
+        if row is None or row["pdf_path"] != str(pdf_path) or head is None:
+            return None
+        changes = _write_arrival(cur, bl, head["date"], head["port"], head["notes"], items)
+    _notify_arrival_write([changes])
+    return changes
+
+@timed("db.fail_pending_items")
+def fail_pending_items(bl, error):
+    with connection() as conn:
+        conn.execute("UPDATE pending_items SET error = ? WHERE bl = ?", (error, bl))
+
+@timed("db.upsert_arrivals_batch")
+def upsert_arrivals_batch(rows):
+    """Guarda muchas llegadas en una sola transacción.
+
+    `rows`: iterable de dicts {bl, date, port?, notes?, items, sha256?, path?};
+    si traen sha256 quedan registradas en ingested_files.
+    """
+    now = time.time()
+    changes = []
+    with connection() as conn:
+        cur = conn.cursor()
+        for r in rows:
+            changes.append(_write_arrival(cur, r["bl"], r["date"], r.get("port"), r.get("notes"), r.get("items")))
+            if r.get("sha256"):
+                cur.execute(
+                    "INSERT OR REPLACE INTO ingested_files(sha256, path, bl, ingested_at) VALUES(?,?,?,?)",
+                    (r["sha256"], str(r.get("path") or ""), r["bl"], now)
+                )
+    _notify_arrival_write(changes)
+    return changes
+
+@timed("db.ingested_hashes")
+def ingested_hashes() -> set:
+    with connection() as conn:
+        return {r["sha256"] for r in conn.execute("SELECT sha256 FROM ingested_files")}
+
+
+@timed("db.get_counter")
+def get_counter(name: str) -> int:
+    """Valor actual de un contador de cambios (sube con cada escritura en la tabla)."""
+    with connection() as conn:
+        row = conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+    return row["value"] if row else 0
+
+@timed("db.list_events")
+def list_events(start=None, end=None):
+    """Eventos del calendario; `start`/`end` (YYYY-MM-DD, inclusivos) acotan el rango."""
+    sql, args = "SELECT bl, date FROM arrivals", []
+    if start and end:
+        sql += " WHERE date BETWEEN ? AND ?"
+        args = [start, end]
+    elif start:
+        sql += " WHERE date >= ?"
+        args = [start]
+    elif end:
+        sql += " WHERE date <= ?"
+        args = [end]
+    with connection() as conn:
+        rows = conn.execute(sql + " ORDER BY date", args).fetchall()
     return [
         {"id": r["bl"], "title": f"Llegada: {r['bl']}", "start": r["date"], "allDay": True}
         for r in rows
     ]
 
+@timed("db.changes_since")
+def changes_since(last_id: int, limit: int = 500):
+    """Cambios del registro posteriores a `last_id`, en orden."""
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT id, bl, kind, date, old_date FROM change_log WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, limit)
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+@timed("db.change_log_bounds")
+def change_log_bounds():
+    """(id más antiguo conservado, id más reciente); (None, 0) si el registro está vacío."""
+    with connection() as conn:
+        r = conn.execute("SELECT MIN(id), COALESCE(MAX(id), 0) FROM change_log").fetchone()
+    return r[0], r[1]
+
+# ---------------- Snapshots del calendario (ver snapshots.py) ----------------
+@timed("db.calendar_months")
+def calendar_months():
+    """Meses ('YYYY-MM') con al menos una llegada."""
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT substr(date, 1, 7) AS month FROM arrivals WHERE date IS NOT NULL ORDER BY month"
+        ).fetchall()
+    return [r["month"] for r in rows]
+
+@timed("db.calendar_month")
+def calendar_month(month: str):
+    """Llegadas de un mes con sus items: [{bl, date, port, notes, items_pending, items: [...]}]."""
+    start, end = f"{month}-01", f"{month}-31"
+    with connection() as conn:
+        heads = conn.execute(
+            """SELECT a.bl, a.date, a.port, a.notes, p.bl IS NOT NULL AS items_pending
+               FROM arrivals a LEFT JOIN pending_items p ON p.bl = a.bl
+               WHERE a.date BETWEEN ? AND ? ORDER BY a.date, a.bl""", (start, end)
+        ).fetchall()
+        items = conn.execute(
+            """SELECT i.arrival_bl, i.code, i.description, i.meters, i.rolls
+               FROM items i JOIN arrivals a ON a.bl = i.arrival_bl
+               WHERE a.date BETWEEN ? AND ? ORDER BY i.arrival_bl, i.position, i.id""", (start, end)
+        ).fetchall()
+    by_bl = {}
+    for it in items:
+        by_bl.setdefault(it["arrival_bl"], []).append(
+            {"code": it["code"], "description": it["description"], "meters": it["meters"], "rolls": it["rolls"]}
+        )
+    return [{**dict(h), "items_pending": bool(h["items_pending"]), "items": by_bl.get(h["bl"], [])}
+            for h in heads]
+
+# ---------------- Exportación ----------------
+EXPORT_COLUMNS = ("bl", "date", "port", "notes", "code", "description", "meters", "rolls")
+# Orden (y paginación por keyset): llegadas por (date, bl), items de cada una por
+# (position, id), todo sobre índices (ver _m5_export_indexes): no hay sort de todo el join.
+# La clave de una fila es [date o '', bl, position o -1, id o -1]; una llegada sin items
+# sale como una fila con los campos de item vacíos y clave [.., .., -1, -1].
+EXPORT_ARRIVAL_CHUNK = 500
+
+def _export_arrivals(conn, start, end, port, after, chunk):
+    """Llegadas (bl, date, port, notes) en orden, desde la de `after` inclusive.
+
+    Primero las de fecha NULL (como '' en la clave) y después el resto; cada tanda es un
+    rango sobre idx_arrivals_date_bl que empieza donde terminó la anterior.
+    """
+    base, args = [], []
+    if start:
+        base.append("date >= ?")
+        args.append(start)
+    if end:
+        base.append("date <= ?")
+        args.append(end)
+    if port:
+        base.append("port = ?")
+        args.append(port)
+    after_date, after_bl = (after[0] or None, after[1]) if after else (None, None)
+    phases = [("date IS NOT NULL", "(date, bl) {op} (?, ?)", (after_date, after_bl) if after_date else None)]
+    if not (start or end or after_date):
+        phases.insert(0, ("date IS NULL", "bl {op} ?", (after_bl,) if after else None))
+    for cond, range_sql, key in phases:
+        op = ">="
+        while True:
+            where, wargs = base + [cond], list(args)
+            if key is not None:
+                where.append(range_sql.format(op=op))
+                wargs.extend(key)
+            rows = conn.execute(f"SELECT bl, date, port, notes FROM arrivals WHERE {' AND '.join(where)} "
+                                "ORDER BY date, bl LIMIT ?", wargs + [chunk]).fetchall()
+            yield from rows
+            if len(rows) < chunk:
+                break
+            last = rows[-1]
+            key, op = ((last["date"], last["bl"]) if last["date"] else (last["bl"],)), ">"
+
+def iter_export_keyed(start=None, end=None, port=None, after=None, chunk=EXPORT_ARRIVAL_CHUNK):
+    """Genera (clave, fila) en orden de exportación; fila = tupla en el orden de EXPORT_COLUMNS.
+
+    Todo sale de una misma transacción de lectura (una foto consistente de la base).
+    """
+    conn = acquire_conn()
+    own = not conn.in_transaction
+    if own:
+        conn.execute("BEGIN")
+    try:
+        for a in _export_arrivals(conn, start, end, port, after, chunk):
+            head = (a["bl"], a["date"], a["port"], a["notes"])
+            resume = after is not None and (a["date"] or "", a["bl"]) == (after[0], after[1])
+            sql = ("SELECT id, position, code, description, meters, rolls FROM items "
+                   "WHERE arrival_bl = ?")
+            args = [a["bl"]]
+            if resume:
+                sql += " AND (COALESCE(position, -1), id) > (?, ?)"
+                args.extend([after[2], after[3]])
+            found = False
+            for it in conn.execute(sql + " ORDER BY position, id", args):
+                found = True
+                key = [a["date"] or "", a["bl"], it["position"] if it["position"] is not None else -1, it["id"]]
+                yield key, head + (it["code"], it["description"], it["meters"], it["rolls"])
+            if not found and not resume:
+                yield [a["date"] or "", a["bl"], -1, -1], head + (None, None, None, None)
+    finally:
+        if own:
+            conn.rollback()   # solo lectura: cierra la transacción
+
+def iter_export(start=None, end=None, port=None, after=None):
+    """Genera filas (tuplas en el orden de EXPORT_COLUMNS) sin armar el resultado completo."""
+    for _, row in iter_export_keyed(start, end, port, after):
+        yield row
+
+# ---------------- Búsqueda ----------------
+CODE_QUERY_RE = re.compile(r"^[A-Za-z]{2,6}\.[\w.]*$")
+
+# Un prefijo corto ('l*') coincide con casi todos los items y search_items los ordena por
+# fecha antes de aplicar el LIMIT: los términos más cortos que esto van como palabra entera
+# y hace falta al menos uno de este largo.
+SEARCH_MIN_PREFIX = 3
+
+def _fts_query(q: str):
+    """Texto del usuario -> expresión MATCH de FTS5 (None si no hay términos o todos son
+    más cortos que SEARCH_MIN_PREFIX).
+
+    Un código con puntos ('TX.860', 'dc.200.96') busca por prefijo en la columna code;
+    cualquier otra cosa exige todos los términos (como prefijo) en código o descripción.
+    """
+    terms = [t.replace('"', '') for t in q.split()]
+    terms = [t for t in terms if t.strip(".")]
+    if not any(len(t) >= SEARCH_MIN_PREFIX for t in terms):
+        return None
+    if len(terms) == 1 and CODE_QUERY_RE.match(terms[0]):
+        return f'code : "{terms[0]}"*'
+    return " ".join(f'"{t}"*' if len(t) >= SEARCH_MIN_PREFIX else f'"{t}"' for t in terms)
+
+@timed("db.search_items")
+def search_items(q: str, page: int = 1, per_page: int = 20, today: str | None = None):
+    """Items que coinciden con `q`, primero las llegadas próximas (fecha ascendente) y
+    luego las pasadas (más recientes primero). Retorna (total, resultados)."""
+    match = _fts_query(q)
+    if not match:
+        return 0, []
+    today = today or time.strftime("%Y-%m-%d")
+    with connection() as conn:
+        total = conn.execute(
+            "SELECT COUNT(*) FROM items_fts WHERE items_fts MATCH ?", (match,)
+        ).fetchone()[0]
+        rows = conn.execute(
+            """SELECT i.arrival_bl AS bl, a.date, a.port, i.code, i.description, i.meters, i.rolls
+               FROM items_fts f
+               JOIN items i    ON i.id = f.rowid
+               JOIN arrivals a ON a.bl = i.arrival_bl
+               WHERE items_fts MATCH ?
+               ORDER BY (a.date < ?), CASE WHEN a.date >= ? THEN a.date END, a.date DESC, i.id
+               LIMIT ? OFFSET ?""",
+            (match, today, today, per_page, (page - 1) * per_page)
+        ).fetchall()
+    return total, [dict(r) for r in rows]
+
+@timed("db.arrival_cache_get")
+def arrival_cache_get(bl, version):
+    """(etag, body) guardados por cualquier worker para esa versión, o None."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT etag, body FROM arrival_cache WHERE bl = ? AND version = ?", (bl, version)
+        ).fetchone()
+    return (row["etag"], bytes(row["body"])) if row else None
+
+@timed("db.arrival_cache_put")
+def arrival_cache_put(bl, version, etag, body: bytes):
+    with connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO arrival_cache(bl, version, etag, body) VALUES(?,?,?,?)",
+            (bl, version, etag, body)
+        )
+
+@timed("db.get_arrival")
 def get_arrival(bl):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM arrivals WHERE bl = ?", (bl,))
-    arr = cur.fetchone()
-    cur.execute("SELECT code, description, meters, rolls FROM items WHERE arrival_bl = ? ORDER BY id", (bl,))
-    its = cur.fetchall()
-    conn.close()
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM arrivals WHERE bl = ?", (bl,))
+        arr = cur.fetchone()
+        cur.execute("SELECT code, description, meters, rolls FROM items WHERE arrival_bl = ? ORDER BY position, id", (bl,))
+        its = cur.fetchall()
     return arr, its
+
+BATCH_IN_CHUNK = 500   # BLs por cláusula IN (bajo el límite de variables de SQLite)
+
+@timed("db.get_arrivals")
+def get_arrivals(bls):
+    """Detalle de varios BL: {bl: {bl, date, port, notes, items_pending, items: [...]}}.
+
+    Dos consultas por tanda (cabeceras e items con IN) sobre la misma conexión; los BL
+    que no existen no aparecen en el resultado.
+    """
+    bls = list(dict.fromkeys(bls))
+    out = {}
+    with connection() as conn:
+        for i in range(0, len(bls), BATCH_IN_CHUNK):
+            chunk = bls[i:i + BATCH_IN_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            for h in conn.execute(
+                f"""SELECT a.bl, a.date, a.port, a.notes, p.bl IS NOT NULL AS items_pending
+                    FROM arrivals a LEFT JOIN pending_items p ON p.bl = a.bl
+                    WHERE a.bl IN ({marks})""", chunk
+            ).fetchall():
+                out[h["bl"]] = {**dict(h), "items_pending": bool(h["items_pending"]), "items": []}
+            for it in conn.execute(
+                f"""SELECT arrival_bl, code, description, meters, rolls FROM items
+                    WHERE arrival_bl IN ({marks}) ORDER BY arrival_bl, position, id""", chunk
+            ).fetchall():
+                out[it["arrival_bl"]]["items"].append(
+                    {"code": it["code"], "description": it["description"],
+                     "meters": it["meters"], "rolls": it["rolls"]}
+                )
+    return out
+
+# ---------------- Caché de parseo ----------------
+PARSE_CACHE_MAX_BYTES = 32 * 1024 * 1024   # tope de items_json acumulado (LRU)
+
+@timed("db.parse_cache_get")
+def parse_cache_get(sha256: str, stamp: str):
+    """(date_iso, items, strategy) si hay una entrada vigente para ese hash; si no, None."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT date_iso, items_json, strategy FROM parse_cache WHERE sha256 = ? AND stamp = ?",
+            (sha256, stamp)
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute("UPDATE parse_cache SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+    return row["date_iso"], json.loads(row["items_json"]), row["strategy"]
+
+@timed("db.parse_cache_put")
+def parse_cache_put(sha256: str, stamp: str, date_iso, items, strategy):
+    """Guarda un resultado, descarta entradas de otra versión y aplica el tope LRU."""
+    items_json = json.dumps(items, ensure_ascii=False)
+    with connection() as conn:
+        conn.execute("DELETE FROM parse_cache WHERE stamp <> ?", (stamp,))
+        conn.execute(
+            """INSERT OR REPLACE INTO parse_cache(sha256, stamp, date_iso, items_json, strategy, size, last_used)
+               VALUES(?,?,?,?,?,?,?)""",
+            (sha256, stamp, date_iso, items_json, strategy, len(items_json), time.time())
+        )
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM parse_cache").fetchone()[0]
+        if total > PARSE_CACHE_MAX_BYTES:
+            # borra las menos usadas hasta quedar bajo el tope
+            rows = conn.execute("SELECT sha256, size FROM parse_cache ORDER BY last_used").fetchall()
+            victims = []
+            for r in rows:
+                if total <= PARSE_CACHE_MAX_BYTES or r["sha256"] == sha256:
+                    break
+                victims.append((r["sha256"],))
+                total -= r["size"]
+            conn.executemany("DELETE FROM parse_cache WHERE sha256 = ?", victims)
+
+# ---------------- Estrategia por formato de documento ----------------
+@timed("db.layout_strategy_get")
+def layout_strategy_get(fingerprint: str):
+    """(estrategia, parámetros) recordados para ese formato, o None."""
+    with connection() as conn:
+        row = conn.execute("SELECT strategy, params_json FROM layout_strategies WHERE fingerprint = ?",
+                           (fingerprint,)).fetchone()
+    return (row["strategy"], json.loads(row["params_json"])) if row else None
+
+@timed("db.layout_strategy_record")
+def layout_strategy_record(fingerprint: str, sample: str, strategy: str, params: dict, result: str):
+    """Anota el resultado de un documento; `result`: new | hit | miss."""
+    with connection() as conn:
+        conn.execute(
+            """INSERT INTO layout_strategies(fingerprint, sample, strategy, params_json, docs, hits, misses, updated_at)
+               VALUES(?,?,?,?,1,?,?,?)
+               ON CONFLICT(fingerprint) DO UPDATE SET
+                   strategy = excluded.strategy, params_json = excluded.params_json,
+                   docs = docs + 1, hits = hits + excluded.hits, misses = misses + excluded.misses,
+                   updated_at = excluded.updated_at""",
+            (fingerprint, sample, strategy, json.dumps(params), int(result == "hit"), int(result == "miss"),
+             time.time())
+        )
+
+@timed("db.layout_strategy_stats")
+def layout_strategy_stats() -> dict:
+    with connection() as conn:
+        r = conn.execute(
+            "SELECT COUNT(*) AS layouts, COALESCE(SUM(docs), 0) AS docs, "
+            "COALESCE(SUM(hits), 0) AS hits, COALESCE(SUM(misses), 0) AS misses FROM layout_strategies"
+        ).fetchone()
+        by = conn.execute("SELECT strategy, COUNT(*) AS n FROM layout_strategies GROUP BY strategy").fetchall()
+    return {**dict(r), "by_strategy": {b["strategy"]: b["n"] for b in by}}
+
+# ---------------- PDFs subidos (ver storage.py) ----------------
+@timed("db.record_upload")
+def record_upload(sha: str, size: int, filename: str, bl: str):
+    now = time.time()
+    with connection() as conn:
+        conn.execute("""
+            INSERT INTO uploads(sha256, size, created_at, last_seen) VALUES(?,?,?,?)
+            ON CONFLICT(sha256) DO UPDATE SET last_seen = excluded.last_seen
+        """, (sha, size, now, now))
+        conn.execute("""
+            INSERT INTO upload_names(sha256, filename, bl, uploaded_at) VALUES(?,?,?,?)
+            ON CONFLICT(sha256, filename, bl) DO UPDATE SET uploaded_at = excluded.uploaded_at
+        """, (sha, filename, bl, now))
+
+@timed("db.upload_orphans")
+def upload_orphans(before: float):
+    """(sha256, size) de los PDFs sin uso subidos por última vez antes de `before`.
+
+    En uso: la última subida de un BL que existe, o lo que espera un job o pending_items.
+    """
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT u.sha256, u.size FROM uploads u
+            WHERE u.last_seen < ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM upload_names n JOIN arrivals a ON a.bl = n.bl
+                  WHERE n.sha256 = u.sha256
+                    AND n.uploaded_at = (SELECT MAX(m.uploaded_at) FROM upload_names m WHERE m.bl = n.bl))
+              AND NOT EXISTS (
+                  SELECT 1 FROM jobs j WHERE j.state IN ('queued','running')
+                    AND j.pdf_path LIKE '%' || u.sha256 || '.pdf')
+              AND NOT EXISTS (
+                  SELECT 1 FROM pending_items p WHERE p.pdf_path LIKE '%' || u.sha256 || '.pdf')
+        """, (before,)).fetchall()
+    return [(r["sha256"], r["size"]) for r in rows]
+
+@timed("db.forget_upload")
+def forget_upload(sha: str):
+    with connection() as conn:
+        conn.execute("DELETE FROM upload_names WHERE sha256 = ?", (sha,))
+        conn.execute("DELETE FROM uploads WHERE sha256 = ?", (sha,))
+
+# ---------------- Cola de ingesta ----------------
+@timed("db.create_job")
+def create_job(pdf_path, bl, port=None, notes=None, date=None) -> int:
+    with connection() as conn:
+        cur = conn.execute(
+            "INSERT INTO jobs(pdf_path, bl, port, notes, date, created_at) VALUES(?,?,?,?,?,?)",
+            (str(pdf_path), bl, port, notes, date, time.time())
+        )
+        return cur.lastrowid
+
+@timed("db.claim_job")
+def claim_job(job_id: int):
+    """Pasa un job de 'queued' a 'running'; retorna la fila o None si otro worker ya lo tomó."""
+    with connection() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET state = 'running', started_at = ? WHERE id = ? AND state = 'queued'",
+            (time.time(), job_id)
+        )
+        if cur.rowcount != 1:
+            return None
+        return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+@timed("db.finish_job")
+def finish_job(job_id: int, result=None, error=None):
+    with connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET state = ?, result_json = ?, error = ?, finished_at = ? WHERE id = ?",
+            ("error" if error else "done",
+             json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, time.time(), job_id)
+        )
+
+# nombre original del PDF (el del almacén es el hash)
+JOB_SELECT = """
+    SELECT jobs.*, (SELECT n.filename FROM upload_names n
+                    WHERE n.bl = jobs.bl AND jobs.pdf_path LIKE '%' || n.sha256 || '.pdf'
+                    ORDER BY n.uploaded_at DESC LIMIT 1) AS filename
+    FROM jobs"""
+
+def _job_to_dict(r):
+    return {
+        "id": r["id"], "state": r["state"], "bl": r["bl"],
+        "pdf": r["filename"] or Path(r["pdf_path"]).name,
+        "result": json.loads(r["result_json"]) if r["result_json"] else None,
+        "error": r["error"],
+        "created_at": r["created_at"], "started_at": r["started_at"], "finished_at": r["finished_at"],
+        "queued_s":  (r["started_at"] - r["created_at"]) if r["started_at"] else None,
+        "elapsed_s": (r["finished_at"] - r["started_at"]) if r["finished_at"] and r["started_at"] else None,
+    }
+
+@timed("db.get_job")
+def get_job(job_id: int):
+    with connection() as conn:
+        row = conn.execute(JOB_SELECT + " WHERE id = ?", (job_id,)).fetchone()
+    return _job_to_dict(row) if row else None
+
+@timed("db.list_jobs")
+def list_jobs(state=None, limit=50):
+    sql, args = JOB_SELECT, []
+    if state:
+        sql += " WHERE state = ?"
+        args.append(state)
+    with connection() as conn:
+        rows = conn.execute(sql + " ORDER BY id DESC LIMIT ?", args + [limit]).fetchall()
+    return [_job_to_dict(r) for r in rows]
+
+@timed("db.requeue_stale_jobs")
+def requeue_stale_jobs(older_than: float) -> int:
+    """Vuelve a 'queued' los jobs en 'running' hace más de `older_than` segundos (el
+    proceso que los tomó murió); retorna cuántos."""
+    with connection() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET state = 'queued', started_at = NULL WHERE state = 'running' AND started_at < ?",
+            (time.time() - older_than,)
+        )
+        return cur.rowcount
+
+@timed("db.pending_job_ids")
+def pending_job_ids(older_than=None):
+    """Jobs en 'queued'; con `older_than` (segundos), solo los encolados antes de eso."""
+    sql, args = "SELECT id FROM jobs WHERE state = 'queued'", []
+    if older_than is not None:
+        sql += " AND created_at < ?"
+        args.append(time.time() - older_than)
+    with connection() as conn:
+        rows = conn.execute(sql + " ORDER BY id", args).fetchall()
+    return [r["id"] for r in rows]
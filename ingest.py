@@ -0,0 +1,267 @@
+# ingest.py
+# Ingesta asíncrona de PDFs: /upload guarda el archivo y encola un job en SQLite;
+# un ProcessPoolExecutor parsea y persiste fuera del hilo del request.
+import logging
+import multiprocessing
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import db
+import metrics
+import snapshots   # registra la regeneración del snapshot del mes tras cada escritura
+
+MAX_WORKERS = 2
+
+# Desde cuántas páginas un job se parsea en streaming: los items van a la base por tandas
+# a medida que se leen las páginas, en vez de armar la lista completa (y sin parse_cache).
+STREAM_MIN_PAGES = 40
+
+# Un job en 'running' hace más que esto quedó huérfano (el worker murió o se reinició la
+# app a mitad de camino) y vuelve a la cola. Holgado para que no se reencole uno que otro
+# worker de gunicorn todavía está procesando. Los workers de escritura lo revisan al
+# arrancar (create_app) y después cada JOB_SWEEP_S.
+JOB_STALE_S = 30 * 60
+JOB_SWEEP_S = 60
+
+log = logging.getLogger(__name__)
+
+_executor = None
+_submitted = set()      # ids enviados al pool de este proceso y aún sin terminar
+_sweeper = None
+
+
+def normalize_date(date: str | None) -> str | None:
+    """Fecha del formulario ('DD-MM-YYYY' o 'YYYY-MM-DD') -> ISO; None si no aplica."""
+    if not date:
+        return None
+    m1 = re.fullmatch(r"(\d{2})-(\d{2})-(\d{4})", date)
+    if m1:
+        return f"{m1.group(3)}-{m1.group(2)}-{m1.group(1)}"
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", date):
+        return date
+    return None
+
+
+def run_job(job_id: int):
+    """Se ejecuta en el proceso worker: parsea el PDF del job y guarda la llegada.
+
+    Retorna las métricas colectadas para que el proceso web las registre (replay).
+    """
+    from parser_pdf import cache_lookup, open_pdf, parse_document_cached
+
+    metrics.start_collect()
+    job = db.claim_job(job_id)
+    if job is None:
+        db.release_conn()
+        return metrics.stop_collect()
+    try:
+        # un acierto del caché de parseo no abre el PDF; si hay que abrirlo, el conteo de
+        # páginas y el parseo salen del mismo documento
+        with metrics.span("ingest.parse"):
+            sha, hit = cache_lookup(job["pdf_path"])
+        streamed = False
+        if hit:
+            date_iso, items, _ = hit
+        else:
+            with open_pdf(job["pdf_path"]) as doc:
+                streamed = doc.page_count >= STREAM_MIN_PAGES
+                if streamed:
+                    with metrics.span("ingest.stream"):
+                        date_iso, n_items = _stream_job(job, doc)
+                else:
+                    with metrics.span("ingest.parse"):
+                        date_iso, items = parse_document_cached(doc, sha)
+        if not streamed:
+            _check_parsed(date_iso, items)
+            date_iso = normalize_date(job["date"]) or date_iso
+            n_items = len(items)
+
+            with metrics.span("ingest.upsert"):
+                db.upsert_arrival(bl=job["bl"], date=date_iso, port=job["port"], notes=job["notes"], items=items)
+        metrics.inc("ingest_jobs_total", state="done")
+        db.finish_job(job_id, result={
+            "bl": job["bl"], "date": date_iso, "port": job["port"],
+            "notes": job["notes"], "items": n_items,
+            "stages": metrics.stage_breakdown(metrics.collected()),
+        })
+    except Exception as e:
+        traceback.print_exc()
+        metrics.inc("ingest_jobs_total", state="error")
+        db.finish_job(job_id, result={"stages": metrics.stage_breakdown(metrics.collected())},
+                      error=str(e) or e.__class__.__name__)
+    finally:
+        db.release_conn()
+    return metrics.stop_collect()
+
+
+def _check_parsed(date_iso, items):
+    if not date_iso:
+        raise ValueError("No se detectó 'Fecha de llegada a bodega' en el PDF")
+    if not items:
+        raise ValueError("No se detectaron filas en el PDF")
+
+
+def _stream_job(job, doc):
+    """Parsea y guarda en la misma pasada; retorna (fecha, cantidad de items)."""
+    from parser_pdf import PdfStream
+
+    stream = PdfStream(doc=doc, adaptive=True)
+    count = 0
+
+    def items():
+        nonlocal count
+        for _, page_items in stream:
+            count += len(page_items)
+            yield from page_items
+        # dentro de la transacción: si falta algo, upsert_arrival no deja nada escrito
+        _check_parsed(stream.date, count)
+
+    def date():
+        return normalize_date(job["date"]) or stream.date
+
+    db.upsert_arrival(bl=job["bl"], date=date, port=job["port"], notes=job["notes"], items=items())
+    metrics.inc("parse_strategy_total", strategy=stream.strategy or "none")
+    return date(), count
+
+
+def run_fill(bl: str, pdf_path: str):
+    """Worker: extrae los items de una llegada subida en modo diferido.
+
+    Retorna (error o None, métricas colectadas).
+    """
+    from parser_pdf import parse_pdf_cached
+
+    metrics.start_collect()
+    try:
+        with metrics.span("ingest.parse"):
+            _, items = parse_pdf_cached(pdf_path)
+        if not items:
+            raise ValueError("No se detectaron filas en el PDF")
+        with metrics.span("ingest.upsert"):
+            db.complete_pending_items(bl, pdf_path, items)
+        metrics.inc("deferred_items_total", state="done")
+        error = None
+    except Exception as e:
+        traceback.print_exc()
+        metrics.inc("deferred_items_total", state="error")
+        error = str(e) or e.__class__.__name__
+        db.fail_pending_items(bl, error)
+    finally:
+        db.release_conn()
+    return error, metrics.stop_collect()
+
+
+def fill_pending(pending, timeout=None):
+    """Completa en el pool los items de un BL diferido y espera el resultado.
+
+    `pending` es la fila de pending_items. Retorna el error, o None si quedó listo.
+    """
+    fut = _get_executor().submit(run_fill, pending["bl"], pending["pdf_path"])
+    error, events = fut.result(timeout=timeout)
+    metrics.replay(events)
+    return error
+
+
+def sweep_pending(older_than=None, limit=None) -> dict:
+    """Completa en el pool todos los BL diferidos (para el barrido en segundo plano)."""
+    executor = _get_executor()
+    futures = [executor.submit(run_fill, r["bl"], r["pdf_path"])
+               for r in db.list_pending_items(older_than=older_than, limit=limit)]
+    done = errors = 0
+    for fut in futures:
+        error, events = fut.result()
+        metrics.replay(events)
+        if error:
+            errors += 1
+        else:
+            done += 1
+    return {"done": done, "errors": errors}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Crea el pool la primera vez (spawn: no hereda conexiones SQLite ni hilos de Flask)."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker,
+                                        initargs=(str(db.DB_PATH), str(snapshots.SNAPSHOT_DIR)))
+    return _executor
+
+
+def _init_worker(db_path, snapshot_dir):
+    """Los workers usan la misma base y snapshots que el proceso que creó el pool."""
+    db.DB_PATH = Path(db_path)
+    snapshots.SNAPSHOT_DIR = Path(snapshot_dir)
+
+
+def enqueue(pdf_path, bl, port=None, notes=None, date=None) -> int:
+    executor = _get_executor()
+    job_id = db.create_job(pdf_path, bl, port=port, notes=notes, date=date)
+    _submit(executor, job_id)
+    return job_id
+
+
+def _submit(executor, job_id):
+    _submitted.add(job_id)
+    fut = executor.submit(run_job, job_id)
+    fut.add_done_callback(lambda f: _submitted.discard(job_id))
+    fut.add_done_callback(_replay_metrics)
+
+
+def _replay_metrics(fut):
+    if not fut.cancelled() and fut.exception() is None and fut.result():
+        metrics.replay(fut.result())
+
+
+def resume_pending(queued_older_than=None) -> int:
+    """Reenvía al pool los jobs en 'queued' (p. ej. tras un reinicio), más los 'running'
+    abandonados hace más de JOB_STALE_S; retorna cuántos envió.
+
+    `queued_older_than` (segundos) deja fuera los encolados hace poco, que probablemente
+    esperan en el pool de otro worker. El pool se crea solo si hay algo que enviar. Si
+    varios workers de gunicorn reenvían el mismo job no hay doble proceso: claim_job
+    solo deja pasar a uno.
+    """
+    stale = db.requeue_stale_jobs(JOB_STALE_S)
+    if stale:
+        metrics.inc("ingest_jobs_requeued_total", stale)
+    ids = [j for j in db.pending_job_ids(older_than=queued_older_than) if j not in _submitted]
+    if ids:
+        executor = _get_executor()
+        for job_id in ids:
+            _submit(executor, job_id)
+    return len(ids)
+
+
+def start_recovery():
+    """Retoma los jobs pendientes y deja un hilo que repite la revisión cada JOB_SWEEP_S
+    (para los 'running' que quedan huérfanos con la app ya arriba)."""
+    global _sweeper
+    try:
+        resume_pending()
+    finally:
+        db.release_conn()
+    if _sweeper is None or not _sweeper.is_alive():
+        _sweeper = _start_sweeper()
+
+
+def _start_sweeper() -> threading.Thread:
+    t = threading.Thread(target=_sweep_loop, name="ingest-sweep", daemon=True)
+    t.start()
+    return t
+
+
+def _sweep_loop():
+    while True:
+        time.sleep(JOB_SWEEP_S)
+        try:
+            resume_pending(queued_older_than=JOB_STALE_S)
+        except Exception:
+            log.exception("Error revisando jobs pendientes")
+        finally:
+            db.release_conn()
@@ -0,0 +1,156 @@
+# ingest_dir.py
+# Carga masiva de PDFs (temporada completa / históricos) usando todos los núcleos.
+#
+#   python ingest_dir.py uploads/
+#   python ingest_dir.py "historicos/**/*.pdf" --workers 8 --batch 500
+#
+# Los archivos cuyo SHA-256 ya está en ingested_files se omiten, así que basta con
+# volver a ejecutar el mismo comando para retomar una carga interrumpida.
+# Los PDF de más de --split-pages páginas (consolidados) se reparten por rangos de
+# páginas entre todos los workers en vez de ocupar uno solo.
+import argparse
+import glob
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import snapshots
+from db import init_db, upsert_arrivals_batch, ingested_hashes, release_conn
+
+
+def find_pdfs(target: str) -> list[Path]:
+    p = Path(target)
+    if p.is_dir():
+        files = p.rglob("*")
+    else:
+        files = (Path(f) for f in glob.glob(target, recursive=True))
+    return sorted(f for f in files if f.is_file() and f.suffix.lower() == ".pdf")
+
+
+def _parse_file(path: str):
+    """Worker: parsea un archivo. Retorna (date_iso, items, páginas) o lanza la excepción."""
+    from parser_pdf import parse_pdf_bytes
+
+    date_iso, items, _, pages = parse_pdf_bytes(Path(path).read_bytes(), adaptive=True)
+    return date_iso, items, pages
+
+
+def _page_count(path: str) -> int:
+    """Páginas del PDF; 0 si no abre (el error lo reporta luego el worker)."""
+    from parser_pdf import page_count
+    try:
+        return page_count(path)
+    except Exception:
+        return 0
+
+
+def _parse_split(path: str, executor, workers: int, pages: int):
+    from parser_pdf import parse_pdf_split
+
+    per_task = max(5, -(-pages // (workers * 2)))   # ~2 rangos por worker
+    date_iso, items, _ = parse_pdf_split(path, executor, pages_per_task=per_task, pages=pages)
+    return date_iso, items, pages
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def run(target: str, workers: int, batch_size: int, split_pages: int = 60) -> int:
+    init_db()
+    files = find_pdfs(target)
+    done = ingested_hashes()
+
+    todo, skipped = [], 0
+    for f in files:
+        sha = _sha256(f)
+        if sha in done:
+            skipped += 1
+            continue
+        done.add(sha)              # duplicados dentro del mismo lote
+        todo.append((f, sha))
+
+    print(f"{len(files)} PDF encontrados, {skipped} ya ingeridos, {len(todo)} por procesar")
+    if not todo:
+        return 0
+
+    # los snapshots del calendario se regeneran una sola vez al final, no por cada BL
+    snapshots.ENABLED = False
+    batch, failures = [], []
+    ok = pages = 0
+    t0 = time.perf_counter()
+
+    def flush():
+        nonlocal batch
+        if batch:
+            upsert_arrivals_batch(batch)
+            batch = []
+
+    def collect(f, sha, parse):
+        nonlocal ok, pages
+        try:
+            date_iso, items, n_pages = parse()
+        except Exception as e:
+            failures.append((f, f"{e.__class__.__name__}: {e}"))
+            return
+        pages += n_pages
+        if not date_iso:
+            failures.append((f, "sin 'Fecha de llegada a bodega'"))
+            return
+        if not items:
+            failures.append((f, "sin filas detectadas"))
+            return
+        batch.append({"bl": f.stem, "date": date_iso, "items": items,
+                      "sha256": sha, "path": f})
+        ok += 1
+        if len(batch) >= batch_size:
+            flush()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            small = []
+            for f, sha in todo:
+                n = _page_count(str(f)) if split_pages else 0
+                if n > split_pages:
+                    # un consolidado grande: todos los workers sobre sus rangos de páginas
+                    collect(f, sha, lambda: _parse_split(str(f), ex, workers, n))
+                else:
+                    small.append((f, sha))
+            futures = {ex.submit(_parse_file, str(f)): (f, sha) for f, sha in small}
+            for fut in as_completed(futures):
+                f, sha = futures[fut]
+                collect(f, sha, fut.result)
+    except KeyboardInterrupt:
+        print("\nInterrumpido: guardando lo ya parseado (vuelve a ejecutar para continuar)…")
+    finally:
+        flush()
+        snapshots.ENABLED = True
+        snapshots.rebuild()
+        release_conn()
+
+    elapsed = time.perf_counter() - t0
+    print(f"✓ {ok} ingeridos, {len(failures)} con error en {elapsed:.2f}s "
+          f"({ok / elapsed:.1f} archivos/s, {pages / elapsed:.1f} páginas/s)")
+    if failures:
+        print("\nErrores:")
+        for f, err in failures:
+            print(f"  {f}: {err}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Ingesta masiva de PDFs de packing list.")
+    ap.add_argument("target", help="directorio o patrón glob (p. ej. 'historicos/**/*.pdf')")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--batch", type=int, default=200, help="llegadas por transacción")
+    ap.add_argument("--split-pages", type=int, default=60,
+                    help="PDF con más páginas se reparten entre los workers (0 = nunca)")
+    args = ap.parse_args()
+    sys.exit(run(args.target, args.workers, args.batch, args.split_pages))
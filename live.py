@@ -0,0 +1,91 @@
+# live.py
+# Difusión de cambios de llegadas a los navegadores conectados a /events/stream.
+#
+# Cada escritura deja una fila en change_log (misma transacción que el cambio), así que
+# sirve para cualquier worker o proceso que escriba. En cada worker web un único hilo
+# consulta change_log cada POLL_S y reparte lo nuevo a las colas de los suscriptores:
+# la carga sobre SQLite no crece con la cantidad de vendedores conectados.
+#
+# Cada conexión SSE ocupa un hilo mientras está abierta: con gunicorn usar workers
+# gthread (--threads) o gevent, no sync.
+import logging
+import queue
+import threading
+import time
+
+import db
+
+POLL_S = 1.0
+HEARTBEAT_S = 15.0
+MAX_QUEUE = 1000    # un suscriptor que no lee más allá de esto se desconecta (recargará)
+
+log = logging.getLogger(__name__)
+
+_subscribers = set()
+_lock = threading.Lock()
+_thread = None
+_last_id = None     # último id repartido; None mientras no hay suscriptores
+
+
+class Overflow(Exception):
+    pass
+
+
+def subscribe() -> queue.Queue:
+    """Cola que recibe listas de cambios (o Overflow). El id de partida del cliente debe
+    leerse después de suscribirse para no perder cambios entre medio."""
+    global _last_id
+    _ensure_thread()
+    q = queue.Queue(maxsize=MAX_QUEUE)
+    with _lock:
+        if _last_id is None:
+            _last_id = db.change_log_bounds()[1]
+        _subscribers.add(q)
+    return q
+
+
+def unsubscribe(q):
+    with _lock:
+        _subscribers.discard(q)
+
+
+def _ensure_thread():
+    global _thread
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _thread = threading.Thread(target=_poll_loop, name="live-poll", daemon=True)
+        _thread.start()
+
+
+def _poll_loop():
+    global _last_id
+    while True:
+        try:
+            with _lock:
+                idle = not _subscribers
+                if idle:
+                    _last_id = None
+            if not idle:
+                changes = db.changes_since(_last_id)
+                if changes:
+                    _last_id = changes[-1]["id"]
+                    _broadcast(changes)
+        except Exception:
+            # base ocupada u otro error transitorio: se reintenta en la próxima vuelta
+            log.exception("Error leyendo change_log")
+        finally:
+            db.release_conn()
+        time.sleep(POLL_S)
+
+
+def _broadcast(changes):
+    with _lock:
+        subs = list(_subscribers)
+    for q in subs:
+        try:
+            q.put_nowait(changes)
+        except queue.Full:
+            unsubscribe(q)
+            q.queue.clear()
+            q.put_nowait(Overflow())
@@ -0,0 +1,409 @@
+# loadtest_api.py
+# Carga de la API con vendedores y admin trabajando a la vez: cuántas sesiones aguanta la
+# app antes de que /events y /arrival/<bl> se degraden.
+#
+#   python loadtest_api.py                                # 10k items, 20 sesiones, 20 s, app en proceso
+#   python loadtest_api.py --items 1000000 --sessions 40 --duration 60
+#   python loadtest_api.py --mix events=60,arrival=35,put=5,upload=0
+#   python loadtest_api.py --url http://bodega:5000 --db /srv/bodega/data.db
+#   python loadtest_api.py --baseline corpus/loadtest/abc1234.json --max-regression 0.25
+#
+# Siembra llegadas sintéticas (BL 'LT-000123', items repartidos) en --db, por defecto una
+# base aparte en loadtest/ con sus propios snapshots y almacén de PDFs; con --url hay que
+# apuntar --db a la base del servidor (o usar --no-seed) y los usuarios ya deben existir.
+# Cada sesión es un navegador con su cookie y sus ETag (manda If-None-Match como el front).
+# PUT vuelve a mandar los items que leyó con una nota nueva (como guardar desde el editor);
+# /upload sube los PDF de uploads/.
+#
+# El resultado (p50/p95/p99, throughput y códigos por endpoint) queda en
+# corpus/loadtest/<commit>.json y se compara con la corrida anterior: sale con código 1 si el
+# p95 de algún endpoint empeora más de --max-regression.
+import argparse
+import io
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+import db
+from bench_parser import git_rev
+
+RESULTS_DIR = Path("corpus/loadtest")
+WORKDIR = Path("loadtest")
+BL_PREFIX = "LT-"
+PORTS = ("San Antonio", "Valparaíso", "Iquique", None)
+CODE_PREFIXES = ("TX", "DC", "IMPO", "TU", "PT")
+WORDS = ("LINO", "POPLIN", "CUERO", "PIQUE", "VERONA", "VICTORIA", "CHARLESTONE", "CREA", "200 HILOS", "PORTO")
+MONTHS_BACK = 18            # las fechas sembradas cubren estos meses hacia atrás...
+MONTHS_AHEAD = 3            # ...y estos hacia adelante
+HOT_SHARE = 0.8             # fracción de lecturas que cae en...
+HOT_FRACTION = 0.2          # ...el 20% de BL más recientes
+
+ENDPOINTS = {
+    "events":  "GET /events",
+    "arrival": "GET /arrival/<bl>",
+    "put":     "PUT /arrival/<bl>",
+    "upload":  "POST /upload",
+}
+
+
+# ---------------- Datos sintéticos ----------------
+def seed(n_items: int, per_arrival: int, rng: random.Random) -> list[str]:
+    """Deja en la base `n_items` items sintéticos en llegadas de `per_arrival`.
+
+    Si ya hay exactamente esa siembra no toca nada. Retorna los BL, del más antiguo al más nuevo.
+    """
+    n_arrivals = max(1, n_items // per_arrival)
+    bls = [f"{BL_PREFIX}{i:06d}" for i in range(n_arrivals)]
+    with db.connection() as conn:
+        have = conn.execute("SELECT COUNT(*) FROM arrivals WHERE bl LIKE ?", (BL_PREFIX + "%",)).fetchone()[0]
+        have_items = conn.execute("SELECT COUNT(*) FROM items WHERE arrival_bl LIKE ?",
+                                  (BL_PREFIX + "%",)).fetchone()[0]
+    if have == n_arrivals and have_items == n_arrivals * per_arrival:
+        return bls
+
+    t0 = time.perf_counter()
+    first = date.today() - timedelta(days=30 * MONTHS_BACK)
+    span = 30 * (MONTHS_BACK + MONTHS_AHEAD)
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM items WHERE arrival_bl LIKE ?", (BL_PREFIX + "%",))
+        cur.execute("DELETE FROM arrivals WHERE bl LIKE ?", (BL_PREFIX + "%",))
+        for i, bl in enumerate(bls):
+            d = first + timedelta(days=i * span // n_arrivals)
+            cur.execute("INSERT INTO arrivals(bl, date, port, notes) VALUES(?,?,?,?)",
+                        (bl, d.isoformat(), rng.choice(PORTS), None))
+            cur.executemany(
+                "INSERT INTO items(arrival_bl, code, description, meters, rolls, position) VALUES(?,?,?,?,?,?)",
+                [(bl, f"{rng.choice(CODE_PREFIXES)}.{rng.randrange(1000):03d}.{rng.randrange(100):02d}.{pos:04d}",
+                  " ".join(rng.sample(WORDS, 3)), round(rng.uniform(10, 3000), 2), rng.randrange(1, 60), pos)
+                 for pos in range(per_arrival)]
+            )
+        db._rebuild_rollup(cur)
+    print(f"Sembrados {n_arrivals} BL / {n_arrivals * per_arrival} items en {time.perf_counter() - t0:.1f}s")
+    return bls
+
+
+def _month_windows(bls_dates):
+    months = sorted({d[:7] for d in bls_dates})
+    out = []
+    for m in months:
+        y, mo = int(m[:4]), int(m[5:])
+        nxt = f"{y + mo // 12:04d}-{mo % 12 + 1:02d}-01"
+        out.append((f"{m}-01", nxt))
+    return out
+
+
+# ---------------- Sesiones ----------------
+class LocalSession:
+    """Navegador sobre el test client de Flask (la app en este proceso)."""
+
+    def __init__(self, app, username, password):
+        self.client = app.test_client()
+        r = self.client.post("/login", data={"username": username, "password": password})
+        if r.status_code != 302:
+            raise RuntimeError(f"Login de {username} falló ({r.status_code})")
+
+    def request(self, method, path, json_body=None, headers=None):
+        r = self.client.open(path, method=method, json=json_body, headers=headers or {})
+        return r.status_code, r.get_data(), r.headers
+
+    def upload(self, fields, filename, data):
+        r = self.client.post("/upload", data={**fields, "pdf": (io.BytesIO(data), filename)},
+                             content_type="multipart/form-data")
+        return r.status_code, r.get_data(), r.headers
+
+
+class HttpSession:
+    """Navegador contra un servidor (cookie de sesión propia)."""
+
+    def __init__(self, base, username, password):
+        import http.cookiejar
+        import urllib.parse
+        import urllib.request
+
+        class NoRedirect(urllib.request.HTTPRedirectHandler):
+            def redirect_request(self, *a, **kw):
+                return None
+
+        self.base = base.rstrip("/")
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                                  NoRedirect)
+        data = urllib.parse.urlencode({"username": username, "password": password}).encode()
+        status, _, _ = self._open("POST", "/login", data, {})
+        if status != 302:
+            raise RuntimeError(f"Login de {username} falló ({status})")
+
+    def _open(self, method, path, body, headers):
+        import urllib.error
+        import urllib.request
+
+        req = urllib.request.Request(self.base + path, data=body, method=method, headers=headers)
+        try:
+            with self.opener.open(req, timeout=60) as r:
+                return r.status, r.read(), r.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+
+    def request(self, method, path, json_body=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        return self._open(method, path, body, headers)
+
+    def upload(self, fields, filename, data):
+        boundary = uuid.uuid4().hex
+        parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode()
+                 for k, v in fields.items()]
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="pdf"; filename="{filename}"\r\n'
+                     f'Content-Type: application/pdf\r\n\r\n'.encode() + data + b"\r\n")
+        parts.append(f"--{boundary}--\r\n".encode())
+        return self._open("POST", "/upload", b"".join(parts),
+                          {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+
+# ---------------- Escenario ----------------
+class Scenario:
+    def __init__(self, bls, windows, pdfs, lazy_upload):
+        self.bls = bls
+        self.windows = windows
+        self.pdfs = pdfs
+        self.lazy_upload = lazy_upload
+
+    def _pick(self, rng, seq):
+        hot = max(1, int(len(seq) * HOT_FRACTION))
+        if rng.random() < HOT_SHARE:
+            return seq[-1 - rng.randrange(hot)]
+        return rng.choice(seq)
+
+    def _cached_get(self, s, etags, path):
+        headers = {"If-None-Match": etags[path]} if path in etags else {}
+        status, body, hdrs = s.request("GET", path, headers=headers)
+        if hdrs.get("ETag"):
+            etags[path] = hdrs["ETag"]
+        return status, body
+
+    def prepare(self, op, sessions, etags, rng):
+        """Lo que el usuario hace antes de la operación medida; retorna la acción a medir."""
+        vendor, admin = sessions
+        if op == "events":
+            start, end = self._pick(rng, self.windows)
+            return lambda: self._cached_get(vendor, etags, f"/events?start={start}&end={end}")[0]
+        if op == "arrival":
+            bl = self._pick(rng, self.bls)
+            return lambda: self._cached_get(vendor, etags, f"/arrival/{bl}")[0]
+        if op == "put":
+            bl = self._pick(rng, self.bls)
+            status, body, _ = admin.request("GET", f"/arrival/{bl}")
+            if status != 200:
+                return lambda: status
+            a = json.loads(body)
+            payload = {"date": a["date"], "port": a["port"], "items": a["items"],
+                       "notes": f"revisado {uuid.uuid4().hex[:8]}"}
+            return lambda: admin.request("PUT", f"/arrival/{bl}", json_body=payload)[0]
+        if op == "upload":
+            name, data = rng.choice(self.pdfs)
+            fields = {"bl": f"{BL_PREFIX}UP-{rng.randrange(50):02d}"}
+            if self.lazy_upload:
+                fields["lazy"] = "1"
+            return lambda: admin.upload(fields, name, data)[0]
+        raise ValueError(op)
+
+
+def run_load(make_sessions, scenario, mix, n_sessions, duration, think_s, seed_base):
+    ops, weights = zip(*mix.items())
+    results = {op: [] for op in ops}     # (latencia_s, status)
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+    barrier = threading.Barrier(n_sessions)
+
+    def worker(i):
+        rng = random.Random(seed_base + i)
+        sessions = make_sessions(i)
+        etags = {}
+        local = {op: [] for op in ops}
+        barrier.wait()
+        while time.perf_counter() < stop_at:
+            op = rng.choices(ops, weights)[0]
+            action = scenario.prepare(op, sessions, etags, rng)
+            t0 = time.perf_counter()
+            status = action()
+            local[op].append((time.perf_counter() - t0, status))
+            if think_s:
+                time.sleep(rng.expovariate(1 / think_s))
+        with lock:
+            for op, rs in local.items():
+                results[op].extend(rs)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(n_sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - t0
+
+
+def summarize(samples, wall):
+    lat = sorted(s for s, _ in samples)
+    codes = {}
+    for _, st in samples:
+        codes[str(st)] = codes.get(str(st), 0) + 1
+    if not lat:
+        return {"requests": 0, "errors": 0, "status": {}}
+    q = statistics.quantiles(lat, n=100, method="inclusive") if len(lat) > 1 else lat * 99
+    return {
+        "requests": len(lat),
+        "errors": sum(n for st, n in codes.items() if int(st) >= 400),
+        "status": codes,
+        "rps": len(lat) / wall,
+        "p50_ms": q[49] * 1000,
+        "p95_ms": q[94] * 1000,
+        "p99_ms": q[98] * 1000,
+        "max_ms": lat[-1] * 1000,
+    }
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Endpoints cuyo p95 empeoró más de `max_regression` (fracción) respecto de `baseline`."""
+    problems = []
+    for name, cur in current["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base or not base.get("requests") or not cur.get("requests"):
+            continue
+        b, c = base["p95_ms"], cur["p95_ms"]
+        if c > b * (1 + max_regression):
+            problems.append(f"{name}: p95 {b:.1f} -> {c:.1f} ms ({(c / b - 1) * 100:.0f}% peor)")
+    return problems
+
+
+def parse_mix(s: str) -> dict:
+    mix = {}
+    for part in s.split(","):
+        op, _, w = part.partition("=")
+        if op.strip() not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Operación desconocida: {op} (usa {', '.join(ENDPOINTS)})")
+        if float(w) > 0:
+            mix[op.strip()] = float(w)
+    if not mix:
+        raise argparse.ArgumentTypeError("La mezcla no tiene operaciones")
+    return mix
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Prueba de carga de la API con sesiones simultáneas.")
+    ap.add_argument("--items", type=int, default=10_000, help="items sintéticos a sembrar (10k a 1M)")
+    ap.add_argument("--items-per-arrival", type=int, default=40)
+    ap.add_argument("--no-seed", action="store_true", help="usar los BL sintéticos que ya haya")
+    ap.add_argument("--db", type=Path, default=WORKDIR / "data.db")
+    ap.add_argument("--url", help="servidor a probar (por defecto, la app en este proceso)")
+    ap.add_argument("--sessions", type=int, default=20, help="navegadores simultáneos")
+    ap.add_argument("--duration", type=float, default=20, help="segundos")
+    ap.add_argument("--think-ms", type=float, default=0, help="pausa media entre acciones de una sesión")
+    ap.add_argument("--mix", type=parse_mix, default=parse_mix("events=45,arrival=45,put=8,upload=2"))
+    ap.add_argument("--lazy-upload", action="store_true", help="subidas con 'solo fecha'")
+    ap.add_argument("--vendor", default="lt_vendor")
+    ap.add_argument("--admin", default="lt_admin")
+    ap.add_argument("--password", default="carga-api")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--baseline", type=Path, help="corrida a comparar (por defecto la anterior)")
+    ap.add_argument("--max-regression", type=float, default=0.3, help="empeoramiento tolerado del p95 (0.3 = 30%%)")
+    args = ap.parse_args()
+
+    db.DB_PATH = args.db
+    args.db.parent.mkdir(parents=True, exist_ok=True)
+    db.init_db()
+    rng = random.Random(args.seed)
+    if args.no_seed:
+        with db.connection() as conn:
+            bls = [r["bl"] for r in conn.execute(
+                "SELECT bl FROM arrivals WHERE bl LIKE ? AND bl NOT LIKE ? ORDER BY date, bl",
+                (BL_PREFIX + "%", BL_PREFIX + "UP-%"))]
+        if not bls:
+            sys.exit(f"No hay BL sintéticos en {args.db}; corre sin --no-seed")
+    else:
+        bls = seed(args.items, args.items_per_arrival, rng)
+    with db.connection() as conn:
+        dates = [r["date"] for r in conn.execute("SELECT DISTINCT date FROM arrivals WHERE bl LIKE ?",
+                                                 (BL_PREFIX + "%",))]
+        n_items = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    pdfs = [(p.name, p.read_bytes()) for p in sorted(Path("uploads").glob("*.pdf"))]
+    if args.mix.get("upload") and not pdfs:
+        sys.exit("Sin PDF en uploads/ para probar /upload")
+    db.release_conn()
+
+    if args.url:
+        def make_sessions(_):
+            return (HttpSession(args.url, args.vendor, args.password),
+                    HttpSession(args.url, args.admin, args.password))
+    else:
+        # la app en proceso usa la base, los snapshots y el almacén de PDFs de la prueba
+        import snapshots
+        import storage
+        snapshots.SNAPSHOT_DIR = args.db.parent / "snapshots"
+        storage.STORE_DIR = args.db.parent / "pdf_store"
+        from app import create_app
+        app = create_app()
+        for user, role in ((args.vendor, "vendor"), (args.admin, "admin")):
+            if db.get_user(user) is None:
+                db.create_user(user, args.password, role)
+        db.release_conn()
+
+        def make_sessions(_):
+            return LocalSession(app, args.vendor, args.password), LocalSession(app, args.admin, args.password)
+
+    scenario = Scenario(bls, _month_windows(dates), pdfs, args.lazy_upload)
+    print(f"{args.sessions} sesiones durante {args.duration:.0f}s contra {args.url or 'la app en proceso'} "
+          f"({len(bls)} BL, {n_items} items)")
+    results, wall = run_load(make_sessions, scenario, args.mix, args.sessions, args.duration,
+                             args.think_ms / 1000, args.seed)
+
+    endpoints = {ENDPOINTS[op]: summarize(rs, wall) for op, rs in results.items()}
+    run = {
+        "rev": git_rev(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "target": args.url or "local",
+        "sessions": args.sessions,
+        "duration_s": wall,
+        "think_ms": args.think_ms,
+        "mix": args.mix,
+        "data": {"arrivals": len(bls), "items": n_items},
+        "endpoints": endpoints,
+        "total": summarize([r for rs in results.values() for r in rs], wall),
+    }
+
+    print(f"\n{'endpoint':<20} {'req':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5}")
+    for name, r in [*endpoints.items(), ("total", run["total"])]:
+        if r["requests"]:
+            print(f"{name:<20} {r['requests']:>7} {r['rps']:>8.1f} {r['p50_ms']:>6.1f}ms "
+                  f"{r['p95_ms']:>6.1f}ms {r['p99_ms']:>6.1f}ms {r['errors']:>5}")
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    runs = sorted(RESULTS_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    baseline_path = args.baseline or (runs[-1] if runs else None)
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path and baseline_path.exists() else None
+    out = RESULTS_DIR / f"{run['rev']}.json"
+    out.write_text(json.dumps(run, indent=1) + "\n", encoding="utf-8")
+    print(f"Resultados en {out}")
+
+    failed = run["total"]["errors"] > 0
+    if failed:
+        print("✗ Hubo respuestas con error (ver 'status' en el JSON)")
+    if baseline:
+        problems = compare(run, baseline, args.max_regression)
+        print(f"Comparado con {baseline_path} ({baseline['rev']})")
+        if problems:
+            failed = True
+            print("✗ Latencia sobre el umbral:\n  " + "\n  ".join(problems))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# loadtest_login.py
+# Simula el inicio de turno: N vendedores entrando a la vez.
+#
+#   python loadtest_login.py                          # 40 logins concurrentes contra la app en proceso
+#   python loadtest_login.py --users 80 --threads 16
+#   python loadtest_login.py --url http://bodega:5000 --password clave
+#   python loadtest_login.py --bench-hash             # costo de cada método de hash candidato
+#
+# Sin --url crea usuarios lt_vendorN (si no existen) en la base local y usa el test client
+# de Flask; con --url los usuarios ya tienen que existir en el servidor.
+import argparse
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# los dos primeros son los defaults de werkzeug (auth.HASH_METHOD = None usa scrypt);
+# el resto solo tiene sentido como override explícito si los números lo justifican
+HASH_CANDIDATES = (
+    "scrypt:32768:8:1",
+    "pbkdf2:sha256:1000000",
+    "pbkdf2:sha256:600000",
+    "scrypt:16384:8:1",
+)
+
+
+def bench_hash(rounds: int):
+    print(f"{'método':<24} {'verificación':>14}")
+    for method in HASH_CANDIDATES:
+        h = generate_password_hash("clave-de-prueba", method=method)
+        times = []
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            check_password_hash(h, "clave-de-prueba")
+            times.append(time.perf_counter() - t0)
+        print(f"{method:<24} {statistics.median(times) * 1000:11.1f} ms")
+
+
+def _local_client_factory(users, password):
+    import auth
+    from app import create_app
+    app = create_app()
+    from db import get_user, create_user
+
+    for u in users:
+        if get_user(u) is None:
+            create_user(u, password, "vendor", hash_method=auth.HASH_METHOD)
+    local = threading.local()
+
+    def login(u):
+        c = getattr(local, "client", None)
+        if c is None:
+            c = local.client = app.test_client()
+        # cada hilo simula un navegador en una IP distinta
+        r = c.post("/login", data={"username": u, "password": password},
+                   environ_base={"REMOTE_ADDR": f"10.0.{hash(u) % 250}.{threading.get_ident() % 250}"})
+        c.get("/logout")
+        return r.status_code
+    return login
+
+
+def _http_factory(base, password):
+    import urllib.error
+    import urllib.parse
+    import urllib.request
+
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *a, **kw):
+            return None
+    opener = urllib.request.build_opener(NoRedirect)
+
+    def login(u):
+        data = urllib.parse.urlencode({"username": u, "password": password}).encode()
+        try:
+            with opener.open(base.rstrip("/") + "/login", data=data, timeout=60) as r:
+                return r.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return login
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=40)
+    ap.add_argument("--threads", type=int, default=40)
+    ap.add_argument("--password", default="turno-manana")
+    ap.add_argument("--url", help="servidor a probar (por defecto, la app en este proceso)")
+    ap.add_argument("--bench-hash", action="store_true")
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    if args.bench_hash:
+        bench_hash(args.rounds)
+        return
+
+    users = [f"lt_vendor{i}" for i in range(args.users)]
+    login = _http_factory(args.url, args.password) if args.url else _local_client_factory(users, args.password)
+
+    def one(u):
+        t0 = time.perf_counter()
+        status = login(u)
+        return status, time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as ex:
+        results = list(ex.map(one, users))
+    wall = time.perf_counter() - t0
+
+    lat = sorted(s for _, s in results)
+    ok = sum(1 for st, _ in results if st == 302)
+    q = statistics.quantiles(lat, n=100) if len(lat) > 1 else lat * 99
+    print(f"{len(results)} logins en {wall:.2f} s ({len(results) / wall:.1f}/s), {ok} correctos")
+    print(f"latencia p50 {q[49] * 1000:.0f} ms  p95 {q[94] * 1000:.0f} ms  máx {lat[-1] * 1000:.0f} ms")
+    others = sorted({st for st, _ in results if st != 302})
+    if others:
+        print("Otros códigos: " + ", ".join(map(str, others)))
+    sys.exit(0 if ok == len(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
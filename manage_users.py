@@ -1,5 +1,6 @@
 # manage_users.py
 from db import init_db, create_user
+from auth import HASH_METHOD
 import sys
 
 def usage():
@@ -14,7 +15,7 @@ if __name__ == "__main__":
     _, _, username, password, role = sys.argv
     init_db()
     try:
-        create_user(username, password, role)
+        create_user(username, password, role, hash_method=HASH_METHOD)
         print(f"✓ Usuario creado: {username} ({role})")
     except Exception as e:
         print("Error:", e)
@@ -0,0 +1,159 @@
+# metrics.py
+# Métricas en memoria (por proceso) con salida en formato de texto de Prometheus.
+#
+#   with span("upload.save"): ...        # histograma stage_seconds{stage="upload.save"}
+#   @timed("db.get_arrival")             # idem, como decorador
+#   inc("parse_strategy_total", strategy="layout")
+#
+# Todo es un perf_counter + un dict bajo lock, así que puede quedar activo en producción.
+# Si el hilo tiene un colector activo (start_collect), cada etapa y contador también se
+# anota ahí: sirve para el desglose de requests lentos y para traer de vuelta lo medido
+# dentro de los procesos de ingest (ver replay).
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+ENABLED = True
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_hists = {}       # (nombre, labels) -> [conteo por bucket..., +Inf, suma]
+_counters = {}    # (nombre, labels) -> valor
+_local = threading.local()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name: str, seconds: float, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        h = _hists.get(key)
+        if h is None:
+            h = _hists[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, b in enumerate(BUCKETS):
+            if seconds <= b:
+                h[i] += 1
+                break
+        else:
+            h[len(BUCKETS)] += 1
+        h[-1] += seconds
+    col = getattr(_local, "collector", None)
+    if col is not None:
+        col.append(("observe", name, seconds, labels))
+
+
+def inc(name: str, value: float = 1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    col = getattr(_local, "collector", None)
+    if col is not None:
+        col.append(("inc", name, value, labels))
+
+
+def observe_stage(stage: str, seconds: float):
+    observe("stage_seconds", seconds, stage=stage)
+
+
+@contextmanager
+def span(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def timed(stage: str):
+    def wrap(fn):
+        @wraps(fn)
+        def deco(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe_stage(stage, time.perf_counter() - t0)
+        return deco
+    return wrap
+
+
+# ---------- colector por hilo ----------
+def start_collect():
+    _local.collector = []
+
+
+def stop_collect() -> list:
+    col = getattr(_local, "collector", None) or []
+    _local.collector = None
+    return col
+
+
+def collected() -> list:
+    """Lo colectado hasta ahora, sin detener el colector."""
+    return list(getattr(_local, "collector", None) or [])
+
+
+def stage_breakdown(events) -> dict:
+    """{etapa: segundos acumulados} a partir de lo colectado."""
+    out = {}
+    for kind, name, value, labels in events:
+        if kind == "observe" and name == "stage_seconds":
+            out[labels["stage"]] = out.get(labels["stage"], 0.0) + value
+    return out
+
+
+def replay(events):
+    """Registra en este proceso lo colectado en otro (p. ej. un worker de ingest)."""
+    for kind, name, value, labels in events:
+        (observe if kind == "observe" else inc)(name, value, **labels)
+
+
+# ---------- exposición ----------
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+
+def render(gauges=()) -> str:
+    """Texto Prometheus. `gauges`: iterable de (nombre, valor, {labels})."""
+    lines = []
+    with _lock:
+        hists = {k: list(v) for k, v in _hists.items()}
+        counters = dict(_counters)
+
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+
+    for (name, labels), h in sorted(hists.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cum = 0
+        for b, n in zip(BUCKETS, h):
+            cum += n
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', b)])} {cum}")
+        cum += h[len(BUCKETS)]
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {cum}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-1]}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {cum}")
+
+    for name, value, labels in gauges:
+        if name not in seen:
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        lines.append(f"{name}{_fmt_labels(sorted(labels.items()))} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,15 @@
 
+import hashlib
 import re
+import statistics
+import time
+from contextlib import contextmanager
 import fitz  # PyMuPDF
 from typing import Optional, Tuple, List
 
+import metrics
+from pdf_tokens import Kind, Token, SEPARATORS, NON_NUMBER_RE, NON_CODE_RE, DOTS_RE, SPACES_RE, patterns_for
+
 # -------------------------------
 # Prefijos aceptados (agrega los que necesites)
 # -------------------------------
@@ -12,7 +19,16 @@ PREFIXES = {
 }
 PREFIX_RE_STR = "(?:" + "|".join(sorted(PREFIXES, key=len, reverse=True)) + ")"
 
+# Súbelo cuando cambie la lógica de extracción: invalida la caché de parseo.
+PARSER_VERSION = "2"
+
 DATE_RE = re.compile(r"(\d{1,2}[\/\-.]\d{1,2}[\/\-.]\d{2,4})", re.IGNORECASE)
+DATE_SPLIT_RE = re.compile(r"[\/\-.]")
+
+
+def _patterns():
+    """Expresiones compiladas para el PREFIXES vigente (cacheadas por conjunto)."""
+    return patterns_for(frozenset(PREFIXES))
 
 
 def _normalize_number(s: str) -> float:
@@ -22,7 +38,7 @@ def _normalize_number(s: str) -> float:
         t = t.replace(".", "").replace(",", ".")
     elif "," in t and "." not in t:
         t = t.replace(",", ".")
-    t = re.sub(r"[^0-9.]", "", t)
+    t = NON_NUMBER_RE.sub("", t)
     try:
         return float(t) if t else 0.0
     except ValueError:
@@ -33,35 +49,24 @@ def _to_iso(date_str: str) -> Optional[str]:
     m = DATE_RE.search(date_str or "")
     if not m:
         return None
-    d, mth, y = re.split(r"[\/\-.]", m.group(1))
+    d, mth, y = DATE_SPLIT_RE.split(m.group(1))
     if len(y) == 2:
         y = "20" + y
     return f"{y}-{int(mth):02d}-{int(d):02d}"
 
 
 def _looks_number(tok: str) -> bool:
-    return bool(re.fullmatch(r"[\d.,]+", tok or ""))
+    return bool(_patterns().classify(tok or "") & Kind.NUMBER)
 
 
 def _is_int_token(tok: str) -> bool:
     """Entero puro (para rollos)."""
-    return bool(re.fullmatch(r"\d{1,6}", tok or ""))
+    return bool(_patterns().classify(tok or "") & Kind.INT)
 
 
 def _is_code_token(tok: str) -> bool:
     """Tokens que forman el código (prefijo + separadores + segmentos numéricos)."""
-    t = (tok or "").strip()
-    if not t:
-        return False
-    if re.fullmatch(PREFIX_RE_STR, t.upper()):  # prefijo suelto: DC / TX / IMPO / ...
-        return True
-    if t in {".", "-", "·"}:
-        return True
-    if re.fullmatch(r"\d+\.?", t):  # segmento numérico
-        return True
-    if re.fullmatch(PREFIX_RE_STR + r"\.?", t.upper()):  # prefijo pegado a punto
-        return True
-    return False
+    return bool(_patterns().classify((tok or "").strip()) & Kind.CODE)
 
 
 def _join_code(tokens) -> str:
@@ -69,105 +74,119 @@ def _join_code(tokens) -> str:
     out = []
     for t in tokens:
         tt = (t or "").strip()
-        out.append("." if tt in {".", "-", "·"} else tt)
+        out.append("." if tt in SEPARATORS else tt)
     code = "".join(out)
-    code = re.sub(r"[^\w\.]", "", code)      # deja letras/números/puntos
-    code = re.sub(r"\.+", ".", code).strip(".")
+    code = NON_CODE_RE.sub("", code)      # deja letras/números/puntos
+    code = DOTS_RE.sub(".", code).strip(".")
     return code
 
 
-def _group_words_into_rows(words, y_tol=3.0):
-    """Agrupa palabras por renglones usando Y y tolerancia."""
+ROW_TOL_FACTOR = 1 / 3     # tolerancia vertical = altura mediana de palabra * factor
+ROW_TOL_MIN = 1.0
+
+
+def _row_tolerance(words, factor=None) -> float:
+    """Tolerancia en Y proporcional al tamaño de letra de la página (~3pt con letra de 9pt)."""
+    if not words:
+        return ROW_TOL_MIN
+    h = statistics.median(w[3] - w[1] for w in words)
+    return max(ROW_TOL_MIN, h * (ROW_TOL_FACTOR if factor is None else factor))
+
+
+def _group_words_into_rows(words, y_tol=None):
+    """Agrupa palabras por renglones usando Y y tolerancia; cada renglón sale ordenado por X.
+
+    Las palabras se reparten en cubetas de alto `y_tol` (un recorrido); solo se ordenan
+    las claves de cubeta y las pocas palabras dentro de cada una, no la página entera.
+    """
+    if y_tol is None:
+        y_tol = _row_tolerance(words)
+    buckets = {}
+    for w in words:
+        ry = round(w[1], 1)
+        buckets.setdefault(int(ry // y_tol), []).append((ry, w[0], w))
+
     rows, current, last_y = [], [], None
-    for w in sorted(words, key=lambda w: (round(w[1], 1), w[0])):
-        y = w[1]
-        if last_y is None or abs(y - last_y) <= y_tol:
-            current.append(w)
-            last_y = y if last_y is None else (last_y + y) / 2
-        else:
-            rows.append(current)
-            current = [w]
-            last_y = y
+    for key in sorted(buckets):
+        for _, _, w in sorted(buckets[key], key=lambda e: (e[0], e[1])):
+            y = w[1]
+            if last_y is None or abs(y - last_y) <= y_tol:
+                current.append(w)
+                last_y = y if last_y is None else (last_y + y) / 2
+            else:
+                rows.append(current)
+                current = [w]
+                last_y = y
     if current:
         rows.append(current)
-    return rows
+    return [sorted(r, key=lambda w: w[0]) for r in rows]
 
 
-def _pick_meters_rolls_from_tokens(tokens: List[str]) -> Tuple[Optional[str], Optional[str]]:
+def _resolve_columns(tokens: List[Token]) -> Optional[Tuple[int, int, int]]:
     """
-    Recorre tokens de derecha a izquierda:
+    Un solo recorrido de derecha a izquierda:
     - ROLLOS = primer ENTERO puro
     - METROS = primer número inmediatamente a su izquierda
+    - corte  = segunda aparición (desde la derecha) del texto de metros/rollos;
+               lo que queda a su izquierda es código + descripción
+    Retorna (i_metros, i_rollos, i_corte) o None si la fila no tiene esas columnas.
     """
-    rolls_txt: Optional[str] = None
-    meters_txt: Optional[str] = None
-    for t in reversed(tokens):
-        if _is_int_token(t):
-            rolls_txt = t
-            break
-    if not rolls_txt:
-        return None, None
-    found_rolls = False
-    for t in reversed(tokens):
-        if not found_rolls:
-            if t == rolls_txt:
-                found_rolls = True
-            continue
-        if _looks_number(t):
-            meters_txt = t
-            break
-    if not meters_txt:
-        return None, None
-    return meters_txt, rolls_txt
-
-
-def _parse_rows_layout(page):
+    right = {}        # texto -> posiciones (de derecha a izquierda) de números a la derecha de rollos
+    r = None
+    for i in range(len(tokens) - 1, -1, -1):
+        kind = tokens[i].kind
+        if r is None:
+            if kind & Kind.INT:
+                r = i
+            elif kind & Kind.NUMBER:
+                right.setdefault(tokens[i].text, []).append(i)
+        elif kind & Kind.NUMBER:
+            m = i
+            # a la derecha de rollos no hay ENTEROS, así que solo pueden repetir el texto de metros
+            same = right.get(tokens[m].text, ())
+            cut = same[1] if len(same) >= 2 else (r if same else m)
+            return m, r, cut
+    return None
+
+
+def _parse_rows_layout(page, words=None, row_tol_factor=None):
     """Intento 1: por layout (palabras con coordenadas)."""
     items = []
-    words = page.get_text("words") or []
-    for row in _group_words_into_rows(words, y_tol=3.0):
-        toks = [w[4] for w in sorted(row, key=lambda w: w[0])]
-        if not toks:
+    if words is None:
+        words = page.get_text("words") or []
+    pats = _patterns()
+    for row in _group_words_into_rows(words, _row_tolerance(words, row_tol_factor)):
+        tokens = pats.tokenize(row)
+        if not tokens:
             continue
+        toks = [t.text for t in tokens]
         joined = " ".join(toks).strip()
         if "SUB-TOTAL" in joined.upper():
             continue
         # debe haber un prefijo alfabético (DC/TX/IMPO/TU/...)
-        if not any(re.fullmatch(r"[A-Za-z]{2,6}", (t or "")) for t in toks):
+        if not any(t.kind & Kind.ALPHA for t in tokens):
             continue
 
-        meters_txt, rolls_txt = _pick_meters_rolls_from_tokens(toks)
-        if not meters_txt or not rolls_txt:
+        cols = _resolve_columns(tokens)
+        if cols is None:
             continue
+        m_idx, r_idx, cut_idx = cols
+        meters_txt, rolls_txt = toks[m_idx], toks[r_idx]
 
-        # izquierda de metros/rollos (para code+desc)
-        cut_idx = None
-        seen = 0
-        for i in range(len(toks) - 1, -1, -1):
-            if toks[i] == rolls_txt or toks[i] == meters_txt:
-                seen += 1
-                if seen == 2:
-                    cut_idx = i
-                    break
-        if cut_idx is None:
-            continue
-        left = toks[:cut_idx]
-
-        # código y descripción
-        code_tokens, i = [], 0
-        while i < len(left) and _is_code_token(left[i]):
-            code_tokens.append(left[i])
+        # código y descripción (izquierda de metros/rollos)
+        i = 0
+        while i < cut_idx and tokens[i].kind & Kind.CODE:
             i += 1
-        if not code_tokens:
+        if not i:
             continue
-        code = _join_code(code_tokens)
-        if not re.match(rf"^{PREFIX_RE_STR}\.", code.upper()):
+        code = _join_code(toks[:i])
+        if not pats.code_start_re.match(code.upper()):
             continue
 
-        desc = " ".join(left[i:]).strip()
+        desc = " ".join(toks[i:cut_idx]).strip()
 
         meters = _normalize_number(meters_txt)
-        rolls = int(re.sub(r"\D", "", rolls_txt)) if re.search(r"\d", rolls_txt) else 0
+        rolls = int(rolls_txt)   # INT: solo dígitos
 
         if meters <= 0 and rolls <= 0:
             continue
@@ -178,13 +197,14 @@ def _parse_rows_layout(page):
     return items
 
 
-def _parse_with_tables(page):
-    """Intento 2: detección de tablas de PyMuPDF."""
+def _parse_with_tables(page, table_strategy=None):
+    """Intento 2: detección de tablas de PyMuPDF (`table_strategy`: 'lines' | 'text')."""
     items = []
     try:
-        tf = page.find_tables()
+        tf = page.find_tables(strategy=table_strategy) if table_strategy else page.find_tables()
     except Exception:
         return items
+    pats = _patterns()
 
     for tb in getattr(tf, "tables", []):
         data = tb.extract()
@@ -209,8 +229,8 @@ def _parse_with_tables(page):
             # código con prefijo válido
             code = ""
             for c in cells:
-                if re.match(rf"^{PREFIX_RE_STR}[\s\.\d]+$", c.upper()):
-                    code = re.sub(r"\s+", ".", c).replace("..", ".").strip(".")
+                if pats.table_code_re.match(c.upper()):
+                    code = SPACES_RE.sub(".", c).replace("..", ".").strip(".")
                     break
             if not code:
                 continue
@@ -231,12 +251,12 @@ def _parse_with_tables(page):
                 continue
 
             meters = _normalize_number(meters_txt)
-            rolls = int(re.sub(r"\D", "", rolls_txt)) if re.search(r"\d", rolls_txt) else 0
+            rolls = int(rolls_txt)   # _is_int_token: solo dígitos
 
             # descripción: primera celda no numérica distinta del código
             desc = ""
             for c in cells:
-                if c and c != code and not _looks_number(c) and not re.match(rf"^{PREFIX_RE_STR}[\s\.\d]+$", c.upper()):
+                if c and c != code and not _looks_number(c) and not pats.table_code_re.match(c.upper()):
                     desc = c
                     break
             if not desc:
@@ -246,28 +266,23 @@ def _parse_with_tables(page):
     return items
 
 
-# Intento 3: respaldo por líneas (regex)
-LINE_RE = re.compile(
-    rf"(?P<code>{PREFIX_RE_STR}[\s\.\d]+?)\s+"
-    r"(?P<desc>.+?)\s+"
-    r"(?P<meters>\d[\d\.,]*)\s+"
-    r"(?P<rolls>\d{1,6})(?!\S)",
-    re.IGNORECASE
-)
+# Intento 3: respaldo por líneas (regex, ver TokenPatterns.line_re)
+HSPACE_RE = re.compile(r"[ \t]+")
 
-def _parse_by_lines(page):
+def _parse_by_lines(page, text=None):
     items = []
-    txt = page.get_text("text") or ""
-    txt = re.sub(r"[ \t]+", " ", txt)
+    pats = _patterns()
+    txt = (page.get_text("text") if text is None else text) or ""
+    txt = HSPACE_RE.sub(" ", txt)
     for raw in txt.splitlines():
         line = raw.strip()
         if not line or "SUB-TOTAL" in line.upper():
             continue
-        m = LINE_RE.search(line)
+        m = pats.line_re.search(line)
         if not m:
             continue
-        code = re.sub(r"\s+", ".", m.group("code")).strip(".")
-        if not re.match(rf"^{PREFIX_RE_STR}\.", code.upper()):
+        code = SPACES_RE.sub(".", m.group("code")).strip(".")
+        if not pats.code_start_re.match(code.upper()):
             continue
         desc = m.group("desc").strip()
         meters = _normalize_number(m.group("meters"))
@@ -278,29 +293,381 @@ def _parse_by_lines(page):
     return items
 
 
+DATE_BLOCK_RE = re.compile(r"fecha\s*de\s*llegada[\s\S]{0,120}?a\s*bodega[\s\S]{0,120}", re.IGNORECASE)
+DATE_LOOSE_RE = re.compile(r"bodega[^0-9]{0,40}(\d{1,2}[\/\-.]\d{1,2}[\/\-.]\d{2,4})", re.IGNORECASE)
+
+
+def _find_date(text: str) -> Optional[str]:
+    """Busca 'Fecha de llegada a bodega: dd/mm/aaaa' en el texto acumulado."""
+    m = DATE_BLOCK_RE.search(text)
+    return _to_iso(m.group(0)) if m else None
+
+
+def _find_date_loose(text: str) -> Optional[str]:
+    """Respaldo: 'bodega' seguido de una fecha, con el texto en una sola línea."""
+    mm = DATE_LOOSE_RE.search(SPACES_RE.sub(" ", text))
+    return _to_iso(mm.group(0)) if mm else None
+
+
+class _DateScanner:
+    """Búsqueda de fecha página a página sobre una ventana acotada.
+
+    Cada página se busca junto con la cola de la anterior (WINDOW caracteres), así que
+    una fecha partida entre páginas se encuentra igual que sobre el texto completo,
+    sin acumular el documento entero en memoria.
+    """
+    WINDOW = 4096
+
+    def __init__(self):
+        self.tail = ""
+        self.date = None
+        self.loose = None
+
+    def feed(self, text: str) -> bool:
+        """Agrega una página; True cuando ya se encontró la fecha (no hace falta seguir)."""
+        if self.date:
+            return True
+        window = self.tail + "\n" + text if self.tail else text
+        self.date = _find_date(window)
+        if not self.date and not self.loose:
+            self.loose = _find_date_loose(window)
+        self.tail = window[-self.WINDOW:]
+        return bool(self.date)
+
+    @property
+    def result(self) -> Optional[str]:
+        return self.date or self.loose
+
+
+STRATEGIES = ("layout", "tables", "lines")
+
+# Palabras de encabezado de la tabla de ítems (para reconocer el formato de un proveedor)
+HEADER_WORDS = {"código", "codigo", "descripción", "descripcion", "cantidad", "metros", "rollos",
+                "precio", "color", "total"}
+
+
+def layout_fingerprint(page, words=None):
+    """Huella del formato de un documento a partir de su primera página.
+
+    Tamaño de página, membrete y los encabezados de columna en orden de X. Solo el orden:
+    la posición exacta se corre con el ancho del contenido de cada envío. El membrete son
+    las primeras palabras de arriba hacia abajo sin dígitos: el BL, la fecha o el folio
+    cambian en cada documento del mismo emisor.
+    Retorna (huella, descripción legible).
+    """
+    if words is None:
+        words = page.get_text("words") or []
+    seen, header = set(), []
+    for w in sorted(words, key=lambda w: w[0]):
+        t = w[4].strip(":.").lower()
+        if t in HEADER_WORDS and w[4][:1].isupper() and t not in seen:
+            seen.add(t)
+            header.append(t)
+    top = sorted((w for w in words if not any(c.isdigit() for c in w[4])),
+                 key=lambda w: (round(w[3]), w[0]))
+    letterhead = " ".join(w[4] for w in top[:4])
+    raw = f"{round(page.rect.width)}x{round(page.rect.height)}|{letterhead}|{','.join(header)}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16], raw
+
+
+class PdfStream:
+    """Recorre un PDF página a página. Iterarlo genera (índice de página, items de esa página).
+
+        stream = PdfStream("grande.pdf", pages=(0, 50))
+        for page_no, items in stream: ...
+        stream.date, stream.strategy        # disponibles al terminar
+
+    Solo se emiten páginas con filas, en orden. Sin `strategy`, si el layout no encuentra
+    filas en ninguna página del rango se repite el recorrido con tablas y luego con líneas
+    (igual que parse_pdf). Con `strategy` se usa solo esa; en "tables"/"lines" no se
+    busca la fecha. `pages` es (inicio, fin) al estilo range; `doc` reutiliza un
+    documento ya abierto (no se cierra).
+
+    Con `adaptive`, la estrategia que funcionó se recuerda por huella de formato
+    (db.layout_strategies) y los documentos de un formato conocido van directo a ella,
+    con sus parámetros; si ahí no salen filas se recorre la cadena normal.
+    """
+
+    def __init__(self, pdf_path=None, pages=None, strategy=None, doc=None, adaptive=False):
+        if strategy is not None and strategy not in STRATEGIES:
+            raise ValueError(f"Estrategia desconocida: {strategy}")
+        self.pdf_path = pdf_path
+        self.pages = pages
+        self.requested = strategy
+        self.doc = doc
+        self.adaptive = adaptive and strategy is None
+        self.date = None
+        self.strategy = None     # la que encontró filas
+        self.page_count = None
+        self._scanner = _DateScanner()
+        self._first = None      # (índice, página, TextPage, palabras) ya extraídos para la huella
+
+    def __iter__(self):
+        if self.doc is not None:
+            yield from self._iter(self.doc)
+            return
+        with open_pdf(self.pdf_path) as doc:
+            yield from self._iter(doc)
+
+    def _iter(self, doc):
+        self.page_count = doc.page_count
+        start, stop = self.pages or (0, doc.page_count)
+        indexes = range(max(start, 0), min(stop, doc.page_count))
+        self.strategy = None
+        order = STRATEGIES if self.requested is None else (self.requested,)
+        known = None
+        if self.adaptive and len(indexes):
+            # la primera página se extrae una vez: la huella y el layout usan las mismas palabras
+            page = doc[indexes[0]]
+            t0 = time.perf_counter()
+            tp = page.get_textpage()
+            words = page.get_text("words", textpage=tp) or []
+            metrics.observe_stage("parse.extract", time.perf_counter() - t0)
+            self._first = (indexes[0], page, tp, words)
+            fingerprint, sample = layout_fingerprint(page, words)
+            known = _layout_memory_get(fingerprint)     # (estrategia, parámetros) o None
+            if known:
+                order = (known[0],) + tuple(n for n in STRATEGIES if n != known[0])
+        try:
+            for name in order:
+                params = known[1] if known and name == known[0] else {}
+                found = False
+                for page_no, items in self._pass(doc, indexes, name, params):
+                    found = True
+                    yield page_no, items
+                if found:
+                    self.strategy = name
+                    break
+        finally:
+            self._first = None
+        if self.adaptive and len(indexes):
+            result = "new" if not known else "hit" if self.strategy == known[0] else "miss"
+            metrics.inc("parse_layout_memory_total", result=result)
+            if self.strategy:
+                _layout_memory_put(fingerprint, sample, self.strategy,
+                                   known[1] if result == "hit" else _default_params(self.strategy), result)
+
+    def _pass(self, doc, indexes, name, params):
+        if name == "layout":
+            yield from self._layout_pass(doc, indexes, params)
+            return
+        scan = self.requested is None
+        elapsed = 0.0
+        try:
+            for i in indexes:
+                page = doc[i]
+                t0 = time.perf_counter()
+                if scan and not self._scanner.date:
+                    self._scanner.feed(page.get_text("text"))
+                    self.date = self._scanner.result
+                if name == "tables":
+                    items = _parse_with_tables(page, params.get("table_strategy"))
+                else:
+                    items = _parse_by_lines(page)
+                elapsed += time.perf_counter() - t0
+                if items:
+                    yield i, items
+        finally:
+            self.date = self._scanner.result
+            metrics.observe_stage(f"parse.{name}", elapsed)
+
+    def _layout_pass(self, doc, indexes, params):
+        # cada página se extrae una sola vez: del mismo TextPage salen texto y palabras
+        clock = time.perf_counter
+        t_extract = t_date = t_layout = 0.0
+        scanner = self._scanner
+        try:
+            for i in indexes:
+                t0 = clock()
+                if self._first and self._first[0] == i:
+                    _, page, tp, words = self._first     # el TextPage es de ese objeto página
+                else:
+                    page = doc[i]
+                    tp = page.get_textpage()
+                    words = page.get_text("words", textpage=tp) or []
+                text = page.get_text("text", textpage=tp) if not scanner.date else None
+                t1 = clock()
+                if text is not None:
+                    scanner.feed(text)
+                t2 = clock()
+                items = _parse_rows_layout(page, words=words, row_tol_factor=params.get("row_tol_factor"))
+                t_extract += t1 - t0
+                t_date += t2 - t1
+                t_layout += clock() - t2
+                self.date = scanner.result
+                if items:
+                    yield i, items
+        finally:
+            self.date = scanner.result
+            metrics.observe_stage("parse.extract", t_extract)
+            metrics.observe_stage("parse.date", t_date)
+            metrics.observe_stage("parse.layout", t_layout)
+
+
+def _default_params(strategy: str) -> dict:
+    """Parámetros con que corre cada estrategia (se guardan junto a la huella y se pueden
+    ajustar a mano en layout_strategies.params_json para un formato puntual)."""
+    if strategy == "layout":
+        return {"row_tol_factor": ROW_TOL_FACTOR}
+    if strategy == "tables":
+        return {"table_strategy": "lines"}
+    return {}
+
+
+def _layout_memory_get(fingerprint):
+    from db import layout_strategy_get
+    return layout_strategy_get(fingerprint)
+
+
+def _layout_memory_put(fingerprint, sample, strategy, params, result):
+    from db import layout_strategy_record
+    layout_strategy_record(fingerprint, sample, strategy, params, result)
+
+
+def _parse_document(doc, adaptive=False):
+    """Fecha + filas de un documento abierto. Retorna (date_iso, items, estrategia).
+
+    Cada página se extrae una sola vez (un TextPage del que salen texto y palabras);
+    la búsqueda de fecha se detiene en cuanto aparece, y las estrategias de respaldo
+    solo corren si el layout no encontró filas en ninguna página.
+    """
+    stream = PdfStream(doc=doc, adaptive=adaptive)
+    items = [it for _, page_items in stream for it in page_items]
+    metrics.inc("parse_strategy_total", strategy=stream.strategy or "none")
+    return stream.date, items, stream.strategy
+
+
+@contextmanager
+def open_pdf(pdf_path):
+    """Abre el PDF con fitz sobre el archivo mapeado en memoria (storage.mapped).
+
+    fitz lee directo del mapeo: el contenido no se copia a un bytes de Python.
+    """
+    from storage import mapped
+    with mapped(pdf_path) as view:
+        with metrics.span("parse.open"):
+            doc = fitz.open(stream=view, filetype="pdf")
+        try:
+            yield doc
+        finally:
+            doc.close()
+
+
 def parse_pdf(pdf_path: str):
-    doc = fitz.open(pdf_path)
-
-    # ---------- FECHA ----------
-    full_text = "\n".join([p.get_text("text") for p in doc])
-    m = re.search(r"fecha\s*de\s*llegada[\s\S]{0,120}?a\s*bodega[\s\S]{0,120}", full_text, re.IGNORECASE)
-    date_iso = _to_iso(m.group(0)) if m else None
-    if not date_iso:
-        one_line = re.sub(r"\s+", " ", full_text)
-        mm = re.search(r"bodega[^0-9]{0,40}(\d{1,2}[\/\-.]\d{1,2}[\/\-.]\d{2,4})", one_line, re.IGNORECASE)
-        if mm:
-            date_iso = _to_iso(mm.group(0))
-
-    # ---------- FILAS ----------
-    items = []
-    for page in doc:
-        items.extend(_parse_rows_layout(page))
-    if not items:
-        for page in doc:
-            items.extend(_parse_with_tables(page))
-    if not items:
+    with open_pdf(pdf_path) as doc:
+        date_iso, items, _ = _parse_document(doc)
+    return date_iso, items
+
+
+def parse_pdf_date(pdf_path: str) -> Optional[str]:
+    """Solo la fecha de llegada: lee texto página a página y se detiene al encontrarla.
+
+    Para la carga diferida (ver ingest.fill_pending): no extrae palabras ni filas.
+    """
+    with open_pdf(pdf_path) as doc, metrics.span("parse.date"):
+        scanner = _DateScanner()
         for page in doc:
-            items.extend(_parse_by_lines(page))
+            if scanner.feed(page.get_text("text")):
+                break
+        return scanner.result
+
+
+def page_count(pdf_path: str) -> int:
+    with open_pdf(pdf_path) as doc:
+        return doc.page_count
+
+
+def parse_pdf_range(pdf_path: str, start: int, stop: int, strategy: str = "layout"):
+    """Worker de parse_pdf_split: (fecha, items) de las páginas [start, stop) con una estrategia."""
+    stream = PdfStream(pdf_path, pages=(start, stop), strategy=strategy)
+    items = [it for _, page_items in stream for it in page_items]
+    return stream.date, items
+
+
+def parse_pdf_split(pdf_path: str, executor, pages_per_task: int = 20, pages: int | None = None):
+    """Como parse_pdf, repartiendo un documento grande en rangos de páginas sobre `executor`.
+
+    Los resultados se unen en orden de página; la fecha es la del primer rango que la tenga.
+    Las estrategias de respaldo se aplican sobre el documento completo, como en parse_pdf.
+    Retorna (date_iso, items, estrategia).
+    """
+    pdf_path = str(pdf_path)
+    n = page_count(pdf_path) if pages is None else pages
+    ranges = [(s, min(s + pages_per_task, n)) for s in range(0, n, pages_per_task)]
+    date_iso = None
+    for strategy in STRATEGIES:
+        parts = [executor.submit(parse_pdf_range, pdf_path, s, e, strategy) for s, e in ranges]
+        results = [f.result() for f in parts]
+        if strategy == "layout":
+            date_iso = next((d for d, _ in results if d), None)
+        items = [it for _, part in results for it in part]
+        if items:
+            return date_iso, items, strategy
+    return date_iso, [], None
+
+
+def parse_pdf_bytes(data: bytes, adaptive: bool = False):
+    """Parsea un PDF en memoria. Retorna (date_iso, items, estrategia, páginas).
+
+    `adaptive`: usa/actualiza la estrategia recordada para el formato (ver PdfStream).
+    """
+    with metrics.span("parse.open"):
+        doc = fitz.open(stream=data, filetype="pdf")
+    try:
+        date_iso, items, strategy = _parse_document(doc, adaptive=adaptive)
+        return date_iso, items, strategy, doc.page_count
+    finally:
+        doc.close()
+
+
+def cache_stamp() -> str:
+    """Identifica la versión del parser y el set de PREFIXES con que se generó un resultado."""
+    raw = PARSER_VERSION + ":" + ",".join(sorted(PREFIXES))
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def cache_lookup(pdf_path: str):
+    """(sha256, acierto o None) del caché de parseo para `pdf_path`.
+
+    La clave es el SHA-256 del contenido: el de un archivo del almacén sale de su nombre,
+    así que un acierto no lee el PDF; los demás se hashean sobre el mapeo en memoria.
+    El acierto es (date_iso, items, estrategia).
+    """
+    from db import parse_cache_get
+    from storage import digest_of, mapped
+
+    sha = digest_of(pdf_path)
+    if sha is None:
+        with mapped(pdf_path) as view:
+            sha = hashlib.sha256(view).hexdigest()
+    hit = parse_cache_get(sha, cache_stamp())
+    metrics.inc("parse_cache_total", result="hit" if hit else "miss")
+    return sha, hit
+
+
+def parse_document_cached(doc, sha: str):
+    """Parsea un documento ya abierto (tras un fallo de cache_lookup) y guarda el resultado."""
+    from db import parse_cache_put
+
+    date_iso, items, strategy = _parse_document(doc, adaptive=True)
+    parse_cache_put(sha, cache_stamp(), date_iso, items, strategy)
+    return date_iso, items
+
 
-    doc.close()
+def parse_pdf_cached(pdf_path: str):
+    """Como parse_pdf, pero reutiliza el resultado si ya se parseó un archivo idéntico
+    (ver cache_lookup): un acierto no abre el PDF."""
+    sha, hit = cache_lookup(pdf_path)
+    if hit:
+        date_iso, items, _ = hit
+        return date_iso, items
+    with open_pdf(pdf_path) as doc:
+        return parse_document_cached(doc, sha)
+
+    if doc is not None:
+        date_iso, items, strategy = _parse_document(doc, adaptive=True)
+    else:
+        with open_pdf(pdf_path) as doc:
+            date_iso, items, strategy = _parse_document(doc, adaptive=True)
+    parse_cache_put(sha, stamp, date_iso, items, strategy)
     return date_iso, items
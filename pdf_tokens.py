@@ -0,0 +1,91 @@
+# pdf_tokens.py
+# Clasificador de tokens para parser_pdf: todas las expresiones se compilan una sola
+# vez por conjunto de PREFIXES y cada palabra se clasifica con un único fullmatch.
+import re
+from enum import IntFlag
+from functools import lru_cache
+from typing import NamedTuple
+
+
+class Kind(IntFlag):
+    NONE   = 0
+    NUMBER = 1   # [\d.,]+            (metros, precios)
+    INT    = 2   # \d{1,6}            (rollos)
+    CODE   = 4   # prefijo, separador o segmento numérico del código
+    ALPHA  = 8   # [A-Za-z]{2,6}      (indica que la fila puede tener prefijo)
+
+
+class Token(NamedTuple):
+    text: str
+    x: float
+    kind: Kind
+
+
+# grupo nombrado -> tipo; el orden de las alternativas define la prioridad
+_KIND_BY_GROUP = {
+    "int":       Kind.INT | Kind.NUMBER | Kind.CODE,
+    "digits":    Kind.NUMBER | Kind.CODE,
+    "seg":       Kind.NUMBER | Kind.CODE,
+    "dot":       Kind.NUMBER | Kind.CODE,
+    "sep":       Kind.CODE,
+    "num":       Kind.NUMBER,
+    "prefix":    Kind.CODE | Kind.ALPHA,
+    "prefixdot": Kind.CODE,
+    "alpha":     Kind.ALPHA,
+}
+
+SEPARATORS = frozenset({".", "-", "·"})
+
+NON_NUMBER_RE = re.compile(r"[^0-9.]")
+NON_CODE_RE   = re.compile(r"[^\w\.]")
+DOTS_RE       = re.compile(r"\.+")
+SPACES_RE     = re.compile(r"\s+")
+
+
+class TokenPatterns:
+    """Expresiones compiladas para un conjunto de prefijos."""
+
+    def __init__(self, prefixes):
+        self.prefixes = frozenset(prefixes)
+        p = "(?:" + "|".join(sorted(self.prefixes, key=len, reverse=True)) + ")"
+        self.prefix_re_str = p
+        self.token_re = re.compile(
+            r"(?P<int>\d{1,6})"
+            r"|(?P<digits>\d+)"
+            r"|(?P<seg>\d+\.)"
+            r"|(?P<dot>\.)"
+            r"|(?P<sep>[-·])"
+            r"|(?P<num>[\d.,]+)"
+            rf"|(?P<prefix>(?i:{p}))"
+            rf"|(?P<prefixdot>(?i:{p})\.)"
+            r"|(?P<alpha>[A-Za-z]{2,6})"
+        )
+        self.code_start_re = re.compile(rf"^{p}\.")            # código ya unido: 'TX.860...'
+        self.table_code_re = re.compile(rf"^{p}[\s\.\d]+$")    # celda de código en tablas
+        self.line_re = re.compile(
+            rf"(?P<code>{p}[\s\.\d]+?)\s+"
+            r"(?P<desc>.+?)\s+"
+            r"(?P<meters>\d[\d\.,]*)\s+"
+            r"(?P<rolls>\d{1,6})(?!\S)",
+            re.IGNORECASE
+        )
+        self._fullmatch = self.token_re.fullmatch
+
+    def classify(self, text: str) -> Kind:
+        m = self._fullmatch(text)
+        return _KIND_BY_GROUP[m.lastgroup] if m else Kind.NONE
+
+    def tokenize(self, words) -> list:
+        """Palabras de PyMuPDF (x0, y0, x1, y1, texto, ...) -> [Token], en el mismo orden."""
+        fm = self._fullmatch
+        out = []
+        for w in words:
+            t = w[4]
+            m = fm(t)
+            out.append(Token(t, w[0], _KIND_BY_GROUP[m.lastgroup] if m else Kind.NONE))
+        return out
+
+
+@lru_cache(maxsize=8)
+def patterns_for(prefixes: frozenset) -> TokenPatterns:
+    return TokenPatterns(prefixes)
@@ -0,0 +1,183 @@
+# snapshots.py
+# Snapshots estáticos del calendario de vendedores: un JSON por mes con los eventos, los
+# totales por día y el detalle de cada BL, regenerado tras cada escritura de llegadas.
+#
+#   snapshots/index.json            {"months": {"2025-10": "2025-10.3f9a1c0b2d4e.json", ...}}
+#   snapshots/2025-10.<hash>.json   nombre versionado por contenido: se sirve con caché larga
+#
+# Una escritura de llegadas solo marca su mes como pendiente; un hilo de fondo regenera
+# cada mes pendiente una vez (las escrituras seguidas se juntan durante REBUILD_DELAY_S), así
+# que PUT /arrival o un job de ingesta no esperan a que se arme el JSON del mes.
+#
+# Los archivos se escriben a un temporal y se publican con os.replace (nunca se ve uno a
+# medias); el índice se reescribe bajo un flock porque pueden regenerar varios procesos
+# (workers web, ingest). Las versiones anteriores se borran pasado SNAPSHOT_KEEP_S, para
+# que un navegador con el índice viejo aún las encuentre.
+#
+#   python snapshots.py        # regenera todos los meses
+import atexit
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import db
+from cache import make_etag
+
+SNAPSHOT_DIR = Path("snapshots")
+SNAPSHOT_KEEP_S = 3600
+REBUILD_DELAY_S = 0.5
+ENABLED = True
+
+INDEX = "index.json"
+
+log = logging.getLogger(__name__)
+
+_dirty = set()                  # meses por regenerar
+_dirty_cond = threading.Condition()
+_thread = None
+
+
+@contextmanager
+def _locked():
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    with open(SNAPSHOT_DIR / ".lock", "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _write_atomic(path: Path, body: bytes):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(body)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_index() -> dict:
+    try:
+        return json.loads((SNAPSHOT_DIR / INDEX).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"months": {}}
+
+
+def month_bundle(month: str) -> dict:
+    arrivals = db.calendar_month(month)
+    totals = {}
+    for a in arrivals:
+        t = totals.setdefault(a["date"], {"meters": 0.0, "rolls": 0, "arrivals": 0})
+        t["arrivals"] += 1
+        for it in a["items"]:
+            t["meters"] += it["meters"] or 0
+            t["rolls"] += it["rolls"] or 0
+    for t in totals.values():
+        t["meters"] = round(t["meters"], 2)
+    return {
+        "month": month,
+        "events": [{"id": a["bl"], "title": f"Llegada: {a['bl']}", "start": a["date"], "allDay": True,
+                    "port": a["port"], "notes": a["notes"]} for a in arrivals],
+        "totals": totals,
+        "details": {a["bl"]: a for a in arrivals},
+    }
+
+
+def rebuild(months=None):
+    """Regenera los meses indicados (todos si es None) y publica el índice."""
+    if not ENABLED:
+        return
+    with _locked():
+        index = read_index()
+        current = index.setdefault("months", {})
+        if months is None:
+            months = set(db.calendar_months()) | set(current)
+        for month in sorted(months):
+            bundle = month_bundle(month)
+            if not bundle["events"]:
+                current.pop(month, None)
+                continue
+            body = json.dumps(bundle, ensure_ascii=False, separators=(",", ":")).encode()
+            name = f"{month}.{make_etag(body)[:12]}.json"
+            if current.get(month) != name:
+                if not (SNAPSHOT_DIR / name).exists():
+                    _write_atomic(SNAPSHOT_DIR / name, body)
+                current[month] = name
+        index["updated_at"] = time.time()
+        _write_atomic(SNAPSHOT_DIR / INDEX, json.dumps(index, indent=1).encode())
+        _gc(set(current.values()))
+
+
+def _gc(live: set):
+    cutoff = time.time() - SNAPSHOT_KEEP_S
+    for p in SNAPSHOT_DIR.glob("*.json"):
+        if p.name != INDEX and p.name not in live and p.stat().st_mtime < cutoff:
+            p.unlink(missing_ok=True)
+
+
+def ensure():
+    """Genera todo si todavía no hay índice (primer arranque)."""
+    if ENABLED and not (SNAPSHOT_DIR / INDEX).exists():
+        rebuild()
+
+
+def mark_dirty(months):
+    """Encola la regeneración de `months` en el hilo de fondo."""
+    global _thread
+    if not ENABLED or not months:
+        return
+    with _dirty_cond:
+        _dirty.update(months)
+        if _thread is None or not _thread.is_alive():   # también tras un fork
+            _thread = threading.Thread(target=_rebuild_loop, name="snapshots", daemon=True)
+            _thread.start()
+        _dirty_cond.notify()
+
+
+def flush():
+    """Regenera ahora los meses pendientes (el hilo de fondo, y al salir del proceso)."""
+    with _dirty_cond:
+        months = set(_dirty)
+        _dirty.clear()
+    if not months:
+        return
+    try:
+        rebuild(months)
+    except Exception:
+        # el cambio ya está guardado; el snapshot se rehace en la próxima escritura del mes
+        log.exception("No se pudo regenerar el snapshot de %s", ", ".join(sorted(months)))
+    finally:
+        db.release_conn()
+
+
+def _rebuild_loop():
+    while True:
+        with _dirty_cond:
+            while not _dirty:
+                _dirty_cond.wait()
+        time.sleep(REBUILD_DELAY_S)
+        flush()
+
+
+atexit.register(flush)   # los scripts que escriben y terminan (sweep_pending, ...) no pierden meses
+
+
+@db.on_arrival_write
+def _on_arrival_write(bl, changes):
+    mark_dirty({d[:7] for d in (changes.get("date"), changes.get("old_date")) if d})
+
+
+if __name__ == "__main__":
+    db.init_db()
+    rebuild()
+    print(f"✓ {len(read_index()['months'])} meses en {SNAPSHOT_DIR}/")
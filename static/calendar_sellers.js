@@ -4,9 +4,11 @@ const ymd = (d)=> `${d.getFullYear()}-${pad2(d.getMonth()+1)}-${pad2(d.getDate()
 const num = (n)=> (Number(n)||0).toLocaleString("es-CL");
 const esCL = new Intl.DateTimeFormat("es-CL", {month:"long", year:"numeric"});
 
-// Trae eventos desde /events y los normaliza
-async function loadEvents(){
-  const r = await fetch("/events");
+// Trae eventos desde /events (solo el rango visible) y los normaliza.
+// El navegador revalida con If-None-Match: si no hubo cambios el servidor responde 304.
+async function loadEvents(start, end){
+  const qs = new URLSearchParams({start: ymd(start), end: ymd(end)});
+  const r = await fetch(`/events?${qs}`, {cache: "no-cache"});
   if(!r.ok) throw new Error(await r.text());
   const arr = await r.json();
   // esperamos: [{id, title, start, port?, notes?, pdf?}]
@@ -20,6 +22,74 @@ async function loadEvents(){
   }));
 }
 
+// Totales por día del rango visible (una sola petición a /summary)
+async function loadDailyTotals(start, end){
+  const qs = new URLSearchParams({start: ymd(start), end: ymd(end), granularity: "day"});
+  const r = await fetch(`/summary?${qs}`, {cache: "no-cache"});
+  if(!r.ok) throw new Error(await r.text());
+  const rows = await r.json();
+  return Object.fromEntries(rows.map(t=> [t.period, t]));
+}
+
+// Snapshots por mes (ver snapshots.py): el índice se revalida, cada mes se cachea por
+// nombre versionado. Si no hay snapshots se vuelve a /events + /summary.
+const DETAILS = {};   // bl -> detalle ya descargado (snapshot o /arrivals/batch)
+let SNAP_INDEX = null;   // mes -> archivo del snapshot pintado; null si se usó la API
+
+async function loadSnapshotIndex(){
+  const r = await fetch("/snapshots/index.json", {cache: "no-cache"});
+  if(!r.ok) return null;
+  return (await r.json()).months || {};
+}
+
+async function loadBundles(index, months){
+  return Promise.all(months.filter(m=> index[m]).map(async m=>{
+    const rm = await fetch(`/snapshots/${index[m]}`);
+    if(!rm.ok) throw new Error(await rm.text());
+    return rm.json();
+  }));
+}
+
+// Eventos y totales de los bundles que caen en [from, to] (YYYY-MM-DD)
+function fromBundles(bundles, from, to){
+  const events = [], totals = {};
+  for(const b of bundles){
+    for(const e of b.events){
+      if(e.start < from || e.start > to) continue;
+      events.push({id: e.id, title: e.title, date: e.start, port: e.port, notes: e.notes, pdf: null});
+    }
+    for(const [day, t] of Object.entries(b.totals)){
+      if(day >= from && day <= to) totals[day] = t;
+    }
+    Object.assign(DETAILS, b.details);
+  }
+  return {events, totals};
+}
+
+async function loadSnapshots(start, end){
+  const index = await loadSnapshotIndex();
+  if(!index) return null;
+  const months = [];
+  for(let d = new Date(start.getFullYear(), start.getMonth(), 1); d <= end; d.setMonth(d.getMonth()+1)){
+    months.push(`${d.getFullYear()}-${pad2(d.getMonth()+1)}`);
+  }
+  const snap = fromBundles(await loadBundles(index, months), ymd(start), ymd(end));
+  SNAP_INDEX = index;
+  return snap;
+}
+
+// Detalle de todos los BL visibles en una petición (cuando no hay snapshots)
+async function loadDetails(bls){
+  if(!bls.length) return;
+  const r = await fetch("/arrivals/batch", {
+    method: "POST",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify({bls})
+  });
+  if(!r.ok) throw new Error(await r.text());
+  Object.assign(DETAILS, (await r.json()).arrivals);
+}
+
 // Rellena una semana inicial (lunes-domingo) antes del día 1
 function startOfCalendar(year, monthIndex){ // monthIndex: 0..11
   const d1 = new Date(year, monthIndex, 1);
@@ -47,9 +117,12 @@ async function renderDetail(bl){
   d_rows.innerHTML = ""; d_m.textContent = ""; d_r.textContent = "";
 
   try{
-    const r = await fetch(`/arrival/${encodeURIComponent(bl)}`);
-    if(!r.ok) throw new Error(await r.text());
-    const data = await r.json();
+    let data = DETAILS[bl];
+    if(!data || data.items_pending){
+      const r = await fetch(`/arrival/${encodeURIComponent(bl)}`);
+      if(!r.ok) throw new Error(await r.text());
+      data = await r.json();
+    }
 
     d_title.textContent = `Detalle contenedor ${data.bl}`;
     d_meta.textContent  = `Fecha: ${data.date} ${data.port? " | Puerto: "+data.port:""} ${data.notes? " | Notas: "+data.notes:""}`;
@@ -78,6 +151,8 @@ async function renderDetail(bl){
 }
 
 // --- render calendar ---
+const CELLS = {};   // YYYY-MM-DD -> celda del mes visible
+
 async function renderCalendar(state){
   const grid = document.getElementById("calGrid");
   const title = document.getElementById("calTitle");
@@ -91,45 +166,120 @@ async function renderCalendar(state){
   const start = startOfCalendar(state.year, state.month);
   const end   = endOfCalendar(state.year, state.month);
 
-  // eventos
-  const events = await loadEvents();
+  // eventos + totales por día: del snapshot del mes o, si no hay, de la API
+  let snap = null;
+  try{ snap = await loadSnapshots(start, end); }catch(err){ console.warn(err); }
+  if(!snap) SNAP_INDEX = null;
+  const [events, totals] = snap ? [snap.events, snap.totals]
+    : await Promise.all([loadEvents(start, end), loadDailyTotals(start, end)]);
+  if(!snap) loadDetails(events.map(e=> e.id)).catch(err=> console.warn(err));
   const eventsByDate = events.reduce((acc,e)=>{
     if(e.date){ (acc[e.date] ||= []).push(e); }
     return acc;
   }, {});
 
   // pintar celdas
+  for(const k in CELLS) delete CELLS[k];
   for(let d=new Date(start); d<=end; d.setDate(d.getDate()+1)){
     const iso = ymd(d);
     const inMonth = (d.getMonth() === state.month);
 
     const cell = document.createElement("div");
     cell.className = "cell" + (inMonth? "" : " out");
+    fillCell(cell, d, eventsByDate[iso] || [], totals[iso]);
+    CELLS[iso] = cell;
+    grid.appendChild(cell);
+  }
+}
 
-    const day = document.createElement("div");
-    day.className = "day";
-    day.textContent = String(d.getDate());
-    cell.appendChild(day);
-
-    const evs = eventsByDate[iso] || [];
-    if(evs.length === 0){
-      const span = document.createElement("div");
-      span.className = "no-events";
-      span.textContent = "—";
-      cell.appendChild(span);
-    }else{
-      evs.forEach(e=>{
-        const pill = document.createElement("div");
-        pill.className = "pill";
-        pill.title = e.title + (e.port? ` • ${e.port}` : "");
-        pill.textContent = e.title;
-        pill.addEventListener("click", ()=> renderDetail(e.id));
-        cell.appendChild(pill);
-      });
-    }
+function fillCell(cell, d, evs, t){
+  cell.replaceChildren();
+  const day = document.createElement("div");
+  day.className = "day";
+  day.textContent = String(d.getDate());
+  cell.appendChild(day);
 
-    grid.appendChild(cell);
+  if(evs.length === 0){
+    const span = document.createElement("div");
+    span.className = "no-events";
+    span.textContent = "—";
+    cell.appendChild(span);
+    return;
+  }
+  evs.forEach(e=>{
+    const pill = document.createElement("div");
+    pill.className = "pill";
+    pill.title = e.title + (e.port? ` • ${e.port}` : "");
+    pill.textContent = e.title;
+    pill.addEventListener("click", ()=> renderDetail(e.id));
+    cell.appendChild(pill);
+  });
+  if(t && (t.meters || t.rolls)){
+    const tot = document.createElement("div");
+    tot.className = "totals";
+    tot.textContent = `${num(t.meters)} m · ${num(t.rolls)} rollos`;
+    cell.appendChild(tot);
+  }
+}
+
+// Cambios en vivo: no se consulta la API por cada cambio (serían todas las pestañas
+// abiertas contra SQLite). Se revalida index.json (304 si no cambió) y se baja el bundle
+// nuevo de los meses visibles afectados. El servidor regenera el snapshot unos instantes
+// después de la escritura, así que se reintenta hasta que cambie el nombre del mes.
+const SNAP_WAIT_MS = 1000;
+const SNAP_TRIES = 5;
+const PENDING_MONTHS = new Set();
+let patchTimer = null;
+
+function visibleMonths(){
+  return new Set(Object.keys(CELLS).map(iso=> iso.slice(0,7)));
+}
+
+// Repinta los días visibles de `months` desde sus snapshots; retorna los que aún no cambiaron
+async function patchMonths(months){
+  const index = await loadSnapshotIndex();
+  if(!index || !SNAP_INDEX) return months;
+  const ready = months.filter(m=> index[m] !== SNAP_INDEX[m]);
+  const bundles = await loadBundles(index, ready);
+  for(const m of ready){
+    const days = Object.keys(CELLS).filter(iso=> iso.startsWith(m)).sort();
+    if(!days.length) continue;
+    const {events, totals} = fromBundles(bundles, days[0], days[days.length-1]);
+    for(const iso of days){
+      fillCell(CELLS[iso], new Date(iso + "T00:00:00"), events.filter(e=> e.date === iso), totals[iso]);
+    }
+    SNAP_INDEX[m] = index[m];
   }
+  return months.filter(m=> !ready.includes(m));
+}
+
+function schedulePatch(state, tries = SNAP_TRIES){
+  clearTimeout(patchTimer);
+  patchTimer = setTimeout(async ()=>{
+    const months = [...PENDING_MONTHS].filter(m=> visibleMonths().has(m));
+    PENDING_MONTHS.clear();
+    if(!months.length) return;
+    if(!SNAP_INDEX) return renderCalendar(state);   // sin snapshots: una recarga por tanda
+    try{
+      const waiting = await patchMonths(months);
+      waiting.forEach(m=> PENDING_MONTHS.add(m));
+      if(waiting.length && tries > 1) schedulePatch(state, tries - 1);
+    }catch(err){ console.warn(err); }
+  }, SNAP_WAIT_MS);
+}
+
+// Cambios en vivo (/events/stream): {bl, kind: added|moved|updated, date, old_date}
+function listenChanges(state){
+  if(!window.EventSource) return;
+  const es = new EventSource("/events/stream");
+  es.onmessage = (ev)=>{
+    const ch = JSON.parse(ev.data);
+    delete DETAILS[ch.bl];
+    [ch.date, ch.old_date].filter(Boolean).forEach(d=> PENDING_MONTHS.add(d.slice(0,7)));
+    schedulePatch(state);
+  };
+  // se perdieron cambios (reconexión tardía): se recarga el mes completo
+  es.addEventListener("reset", ()=> renderCalendar(state));
 }
 
 // --- init ---
@@ -151,4 +301,5 @@ document.addEventListener("DOMContentLoaded", ()=>{
   });
 
   renderCalendar(state);
+  listenChanges(state);
 });
@@ -33,6 +33,31 @@ async function fetchJSON(url, opts={}){
   return r.json();
 }
 
+// ========= detalle de varios BL en una sola petición =========
+const DETAILS = {};   // bl -> detalle (se renueva en cada loadList)
+const LIST_PREFETCH = 60;
+
+async function loadDetails(bls){
+  const want = bls.filter(Boolean);
+  if(!want.length) return {};
+  const res = await fetchJSON("/arrivals/batch", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ bls: want })
+  });
+  Object.assign(DETAILS, res.arrivals);
+  return res.arrivals;
+}
+
+// detalle de un BL: del lote ya cargado o de /arrival/<bl> (que extrae los items diferidos)
+async function getDetail(bl, fresh=false){
+  const d = DETAILS[bl];
+  if(!fresh && d && !d.items_pending) return d;
+  const det = await fetchJSON(`/arrival/${encodeURIComponent(bl)}`);
+  DETAILS[bl] = det;
+  return det;
+}
+
 // ========= estado edición / cambios sin guardar =========
 let CURRENT_BL = null;
 let EDIT_MODE  = false;
@@ -95,7 +120,15 @@ async function handleUpload(ev){
 
   const fd = new FormData(form);
   try{
-    const data = await fetchJSON("/upload", { method:"POST", body: fd });
+    const res = await fetchJSON("/upload", { method:"POST", body: fd });
+    // modo "solo fecha": la llegada ya quedó guardada, no hay job que esperar
+    let data = res;
+    if(res.job){
+      status.textContent = "Procesando en segundo plano…";
+      data = await waitForJob(res.job, (st)=>{
+        status.textContent = st === "queued" ? "En cola…" : "Procesando en segundo plano…";
+      });
+    }
 
     // preview rápido
     $("#emptyHint").classList.add("hidden");
@@ -105,13 +138,20 @@ async function handleUpload(ev){
     $("#pDate").textContent = data.date || "—";
     $("#pNotes").textContent= data.notes || "—";
 
-    // leer detalle real (items)
-    const det  = await fetchJSON(`/arrival/${encodeURIComponent(data.bl)}`);
-    fillItems($("#pRows"), det.items, $("#pM"), $("#pR"));
-
-    status.textContent = "Guardado ✔";
-    await loadList();
-    await selectAndShow(data.bl);
+    if(data.items_pending){
+      // no se pide el detalle: eso dispararía la extracción que justamente se difirió
+      fillItems($("#pRows"), [], $("#pM"), $("#pR"));
+      status.textContent = "Guardado ✔ (ítems al abrir el BL)";
+      await loadList();
+    }else{
+      // leer detalle real (items): una sola vez, lo reutiliza selectAndShow
+      const det = await getDetail(data.bl, true);
+      fillItems($("#pRows"), det.items, $("#pM"), $("#pR"));
+
+      status.textContent = "Guardado ✔";
+      await loadList();
+      await selectAndShow(data.bl);
+    }
     CURRENT_BL = data.bl;
     toggleButtons();
     form.reset();
@@ -122,6 +162,17 @@ async function handleUpload(ev){
   }
 }
 
+// consulta /jobs/<id> hasta que termine; retorna el resultado o lanza el error del job
+async function waitForJob(id, onState, interval=700){
+  for(;;){
+    const job = await fetchJSON(`/jobs/${id}`);
+    if(job.state === "done")  return job.result;
+    if(job.state === "error") throw new Error(job.error || "Error procesando el PDF");
+    if(onState) onState(job.state);
+    await new Promise(res=> setTimeout(res, interval));
+  }
+}
+
 // ========= lista de contenedores =========
 async function loadList(){
   const events = await fetchJSON("/events");
@@ -143,6 +194,10 @@ async function loadList(){
     item.addEventListener("click", ()=> guardLeaveEdit(()=> selectAndShow(e.id)));
     box.appendChild(item);
   }
+
+  // detalle de los más recientes en un solo lote: abrirlos ya no pide nada al servidor
+  try{ await loadDetails(events.slice(0, LIST_PREFETCH).map(e=> e.id)); }
+  catch(err){ console.warn(err); }
 }
 
 // ========= detalle =========
@@ -150,7 +205,7 @@ async function selectAndShow(bl){
   const cont = document.getElementById("detail");
   cont.classList.remove("hidden");
 
-  const data = await fetchJSON(`/arrival/${encodeURIComponent(bl)}`);
+  const data = await getDetail(bl);
 
   $("#d_title").textContent = `Detalle contenedor ${data.bl}`;
   $("#d_meta").textContent  = `Fecha: ${data.date}` +
@@ -247,6 +302,7 @@ async function saveEdit(){
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(payload)
   });
+  delete DETAILS[CURRENT_BL];
 
   await loadList();
   EDIT_MODE = false;
@@ -261,7 +317,7 @@ document.addEventListener("DOMContentLoaded", ()=>{
 
   $("#btnEdit").addEventListener("click", async ()=>{
     if(!CURRENT_BL) return;
-    const det = await fetchJSON(`/arrival/${encodeURIComponent(CURRENT_BL)}`);
+    const det = await getDetail(CURRENT_BL);
     enterEditMode(det);
   });
   $("#btnSave").addEventListener("click", async ()=>{
@@ -0,0 +1,145 @@
+# storage.py
+# PDFs subidos guardados por contenido: STORE_DIR/<sha[:2]>/<sha256>.pdf
+#
+# El archivo se hashea mientras llega (por bloques, sin armarlo entero en memoria) y solo
+# se publica si ese contenido no estaba: volver a subir el mismo PDF no escribe nada nuevo.
+# El nombre original y el BL de cada subida quedan en SQLite (db.upload_names), así que
+# un mismo contenido puede figurar con varios nombres o BL.
+#
+# Un archivo queda huérfano cuando ya no es la última versión subida de ningún BL existente
+# ni lo espera un job o una carga diferida; gc() los borra pasado ORPHAN_KEEP_S.
+#
+#   python storage.py                  # lista los huérfanos
+#   python storage.py --delete         # los borra
+#   python storage.py --delete --older-than 0
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import NamedTuple
+
+import db
+import metrics
+
+STORE_DIR = Path("pdf_store")
+CHUNK = 1 << 20
+ORPHAN_KEEP_S = 7 * 86400
+TMP_PREFIX = ".tmp-"
+
+
+class Stored(NamedTuple):
+    sha256: str
+    path: Path
+    size: int
+    dedup: bool     # el contenido ya estaba guardado
+
+
+def configure(config):
+    global STORE_DIR
+    STORE_DIR = Path(config.get("UPLOAD_FOLDER", STORE_DIR))
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def path_for(sha: str) -> Path:
+    return STORE_DIR / sha[:2] / f"{sha}.pdf"
+
+
+def digest_of(path) -> str | None:
+    """SHA-256 de un archivo del almacén, sacado del nombre (sin leerlo); None si no es uno."""
+    p = Path(path)
+    sha = p.stem
+    if len(sha) == 64 and p.parent.name == sha[:2] and p.suffix == ".pdf":
+        return sha
+    return None
+
+
+def save_stream(stream, filename: str, bl: str | None = None) -> Stored:
+    """Copia `stream` al almacén hasheando por bloques y registra la subida."""
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=STORE_DIR, prefix=TMP_PREFIX)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            while chunk := stream.read(CHUNK):
+                h.update(chunk)
+                fh.write(chunk)
+                size += len(chunk)
+        sha = h.hexdigest()
+        path = path_for(sha)
+        dedup = path.exists()
+        if dedup:
+            os.unlink(tmp)
+        else:
+            path.parent.mkdir(exist_ok=True)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    db.record_upload(sha, size, filename, bl)
+    metrics.inc("upload_store_total", result="dedup" if dedup else "new")
+    return Stored(sha, path, size, dedup)
+
+
+@contextmanager
+def mapped(path):
+    """memoryview de solo lectura sobre el archivo mapeado en memoria.
+
+    Sirve para hashear y para fitz.open(stream=...) sin copiar el contenido; todo lo que
+    use la vista (p. ej. el documento de fitz) tiene que cerrarse antes de salir.
+    """
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            yield memoryview(b"")
+            return
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        try:
+            yield view
+        finally:
+            view.release()
+            mm.close()
+
+
+def gc(older_than: float = ORPHAN_KEEP_S, delete: bool = False) -> dict:
+    """Huérfanos del almacén (y temporales abandonados) más viejos que `older_than` segundos.
+
+    Con `delete` los borra junto con sus filas de upload_names. Retorna {"files", "bytes"}.
+    """
+    cutoff = time.time() - older_than
+    orphans = [(path_for(sha), size, sha) for sha, size in db.upload_orphans(cutoff)]
+    for tmp in STORE_DIR.glob(TMP_PREFIX + "*"):
+        st = tmp.stat()
+        if st.st_mtime < cutoff:
+            orphans.append((tmp, st.st_size, None))
+    if delete:
+        for path, _, sha in orphans:
+            path.unlink(missing_ok=True)
+            if sha:
+                db.forget_upload(sha)
+                try:
+                    path.parent.rmdir()     # solo si quedó vacío
+                except OSError:
+                    pass
+    return {"files": [str(p) for p, _, _ in orphans], "bytes": sum(s for _, s, _ in orphans)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Archivos del almacén de PDFs que ya nadie usa.")
+    ap.add_argument("--delete", action="store_true", help="borrarlos (por defecto solo lista)")
+    ap.add_argument("--older-than", type=float, default=ORPHAN_KEEP_S / 86400, help="días (7)")
+    args = ap.parse_args()
+
+    db.init_db()
+    res = gc(older_than=args.older_than * 86400, delete=args.delete)
+    for f in res["files"]:
+        print(f)
+    verb = "borrados" if args.delete else "huérfanos"
+    print(f"✓ {len(res['files'])} {verb}, {res['bytes'] / 1e6:.1f} MB")
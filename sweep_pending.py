@@ -0,0 +1,41 @@
+# sweep_pending.py
+# Barrido de llegadas subidas en modo diferido (UPLOAD_LAZY / casilla "solo fecha"):
+# extrae los items que nadie ha abierto todavía. Pensado para cron, fuera de horario.
+#
+#   python sweep_pending.py                    # todos los pendientes
+#   python sweep_pending.py --older-than 6     # solo los subidos hace más de 6 horas
+#   python sweep_pending.py --limit 200
+#   python sweep_pending.py --list             # solo mostrar (incluye los que fallaron)
+import argparse
+import sys
+import time
+
+import db
+import ingest
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Extrae los items pendientes de cargas diferidas.")
+    ap.add_argument("--older-than", type=float, help="horas desde la subida")
+    ap.add_argument("--limit", type=int)
+    ap.add_argument("--list", action="store_true")
+    args = ap.parse_args()
+
+    db.init_db()
+    older = time.time() - args.older_than * 3600 if args.older_than is not None else None
+    if args.list:
+        rows = db.list_pending_items(older_than=older, limit=args.limit, with_errors=True)
+        for r in rows:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["created_at"]))
+            print(f"{r['bl']:<30} {when}  {r['pdf_path']}" + (f"  ✗ {r['error']}" if r["error"] else ""))
+        print(f"{len(rows)} pendientes")
+        return 0
+
+    t0 = time.perf_counter()
+    res = ingest.sweep_pending(older_than=older, limit=args.limit)
+    print(f"✓ {res['done']} completados, {res['errors']} con error en {time.perf_counter() - t0:.2f}s")
+    return 1 if res["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
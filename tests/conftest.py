@@ -0,0 +1,44 @@
+import queue
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import db  # noqa: E402
+import snapshots  # noqa: E402
+import storage  # noqa: E402
+
+UPLOADS = ROOT / "uploads"
+
+
+def _drain_pool():
+    db.release_conn()
+    while True:
+        try:
+            db._pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """Base, almacén y snapshots nuevos en un directorio temporal."""
+    monkeypatch.chdir(tmp_path)
+    _drain_pool()
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "data.db")
+    monkeypatch.setattr(storage, "STORE_DIR", tmp_path / "pdf_store")
+    monkeypatch.setattr(snapshots, "SNAPSHOT_DIR", tmp_path / "snapshots")
+    # sin el hilo de snapshots: podría escribir después de restaurar DB_PATH
+    monkeypatch.setattr(snapshots, "mark_dirty", lambda months: None)
+    db.init_db()
+    db.release_conn()
+    yield tmp_path
+    _drain_pool()
+
+
+@pytest.fixture
+def sample_pdf():
+    return sorted(UPLOADS.glob("*.pdf"))[0]
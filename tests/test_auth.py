@@ -0,0 +1,23 @@
+import auth
+import db
+
+FAST = "pbkdf2:sha256:1000"
+
+
+def test_password_change_applies_on_next_login(tmp_db, monkeypatch):
+    monkeypatch.setattr(auth, "HASH_METHOD", FAST)
+    db.create_user("v", "vieja", "vendor", hash_method=FAST)
+    assert auth.authenticate("v", "vieja")
+
+    # cambio hecho desde otro proceso (p. ej. un script de administración)
+    db.update_password_hash("v", auth.hash_password("nueva"))
+    assert auth.authenticate("v", "vieja") is None
+    assert auth.authenticate("v", "nueva")
+
+
+def test_rehash_when_method_changes(tmp_db, monkeypatch):
+    monkeypatch.setattr(auth, "HASH_METHOD", FAST)
+    db.create_user("v", "clave", "vendor", hash_method="pbkdf2:sha256:2000")
+    assert auth.authenticate("v", "clave")
+    assert db.get_user("v")["password_hash"].startswith(FAST + "$")
+    assert not auth.needs_rehash(db.get_user("v")["password_hash"])
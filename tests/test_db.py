@@ -0,0 +1,27 @@
+import sqlite3
+
+import db
+
+
+def test_migrations_create_their_own_tables():
+    # base anterior a las migraciones: solo llegadas e items, sin pasar por _create_schema
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE arrivals(id INTEGER PRIMARY KEY AUTOINCREMENT, bl TEXT UNIQUE, date TEXT,
+                              port TEXT, notes TEXT);
+        CREATE TABLE items(id INTEGER PRIMARY KEY AUTOINCREMENT, arrival_bl TEXT, code TEXT,
+                           description TEXT, meters REAL, rolls INTEGER);
+        INSERT INTO arrivals(bl, date) VALUES('BL-1', '2025-01-02');
+        INSERT INTO items(arrival_bl, code, description, meters, rolls)
+            VALUES('BL-1', 'TX.1', 'lino', 10, 2);
+    """)
+    db._migrate(conn.cursor())
+
+    names = {r["name"] for r in conn.execute("SELECT name FROM sqlite_master")}
+    assert {"rollup_daily", "items_fts", "trg_items_fts_insert", "pending_items", "change_log",
+            "layout_strategies", "uploads", "upload_names", "idx_upload_names_bl",
+            "idx_arrivals_date_bl"} <= names
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+    assert conn.execute("SELECT rowid FROM items_fts WHERE items_fts MATCH 'lino'").fetchone()
+    assert conn.execute("SELECT meters FROM rollup_daily WHERE prefix = '*'").fetchone()[0] == 10
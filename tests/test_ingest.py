@@ -0,0 +1,58 @@
+import time
+
+import fitz
+import pytest
+
+import db
+import ingest
+import storage
+from parser_pdf import cache_stamp, parse_pdf
+
+
+def _store(pdf):
+    with open(pdf, "rb") as fh:
+        return storage.save_stream(fh, pdf.name, bl="BL-1")
+
+
+def test_run_job_cache_hit_does_not_open_pdf(tmp_db, sample_pdf, monkeypatch):
+    stored = _store(sample_pdf)
+    date_iso, items = parse_pdf(str(sample_pdf))
+    db.parse_cache_put(stored.sha256, cache_stamp(), date_iso, items, "layout")
+
+    def no_open(*args, **kwargs):
+        pytest.fail("fitz.open con el resultado ya en caché")
+    monkeypatch.setattr(fitz, "open", no_open)
+
+    job_id = db.create_job(str(stored.path), "BL-1")
+    ingest.run_job(job_id)
+    job = db.get_job(job_id)
+    assert job["state"] == "done", job["error"]
+    assert job["result"]["items"] == len(items)
+    _, stored_items = db.get_arrival("BL-1")
+    assert len(stored_items) == len(items)
+
+
+def test_create_app_recovers_stale_running_job(tmp_db, sample_pdf, monkeypatch):
+    import app as app_module
+
+    stored = _store(sample_pdf)
+    job_id = db.create_job(str(stored.path), "BL-2")
+    db.claim_job(job_id)
+    with db.connection() as conn:     # lo tomó un worker que murió hace una hora
+        conn.execute("UPDATE jobs SET started_at = started_at - 3600 WHERE id = ?", (job_id,))
+    db.release_conn()
+
+    monkeypatch.setattr(ingest, "_start_sweeper", lambda: None)
+    monkeypatch.setattr(app_module, "_setup_done", False)
+    try:
+        app_module.create_app()
+        deadline = time.time() + 60
+        while db.get_job(job_id)["state"] not in ("done", "error") and time.time() < deadline:
+            time.sleep(0.1)
+    finally:
+        if ingest._executor is not None:
+            ingest._executor.shutdown()
+            ingest._executor = None
+    job = db.get_job(job_id)
+    assert job["state"] == "done", job["error"]
+    assert db.get_arrival("BL-2")[0] is not None
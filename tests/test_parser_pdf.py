@@ -0,0 +1,32 @@
+import fitz
+
+from parser_pdf import layout_fingerprint
+
+
+def _page(bl: str, date: str, issuer: str = "TEXTILES DEL SUR LTDA"):
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    # el número de BL y la fecha se escriben antes que el membrete: quedan primeros al extraer
+    page.insert_text((400, 40), f"BL {bl}")
+    page.insert_text((400, 55), f"Fecha {date}")
+    page.insert_text((50, 60), issuer)
+    x = 50
+    for header in ("Código", "Descripción", "Cantidad", "Metros", "Rollos"):
+        page.insert_text((x, 120), header)
+        x += 100
+    return doc, page
+
+
+def test_fingerprint_ignores_per_document_fields():
+    (d1, p1), (d2, p2) = _page("CHI-056-2025", "01-03-2025"), _page("CHI-131-2025", "17-10-2025")
+    (d3, p3) = _page("CHI-056-2025", "01-03-2025", issuer="OTRO PROVEEDOR SPA")
+    try:
+        fp1, raw1 = layout_fingerprint(p1)
+        fp2, _ = layout_fingerprint(p2)
+        fp3, _ = layout_fingerprint(p3)
+    finally:
+        for d in (d1, d2, d3):
+            d.close()
+    assert fp1 == fp2, raw1
+    assert fp1 != fp3
+    assert "CHI" not in raw1 and "2025" not in raw1
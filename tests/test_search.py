@@ -0,0 +1,23 @@
+import db
+
+
+def _load():
+    db.upsert_arrival("BL-1", "2025-01-02", items=[
+        {"code": "TX.860.01", "description": "lino victoria", "meters": 10, "rolls": 1},
+        {"code": "DC.200.96", "description": "cuero porto", "meters": 5, "rolls": 1},
+    ])
+
+
+def test_short_prefix_does_not_query(tmp_db):
+    _load()
+    assert db._fts_query("l") is None
+    assert db._fts_query("l de") is None
+    assert db.search_items("l") == (0, [])
+
+
+def test_short_terms_match_whole_words(tmp_db):
+    _load()
+    assert db._fts_query("lino v") == '"lino"* "v"'
+    total, rows = db.search_items("lin")
+    assert total == 1 and rows[0]["code"] == "TX.860.01"
+    assert db.search_items("TX.860")[0] == 1